@@ -0,0 +1,124 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from reducers import dump_atomic, embedding_hash
+
+
+def _documents(embeddings, idx):
+    """
+    Returns the documents with the given indices as a C-contiguous float32 array of shape (n, n_features), copying only those documents
+    """
+    return np.ascontiguousarray(embeddings[:, idx].transpose(), dtype=np.float32)
+
+
+def fit_clusters(embeddings, n_clusters = 8, batch_size = 4096, n_epochs = 1, random_state = 0, cache_dir = None):
+    """
+    Clusters the documents in the full-dimensional embedding space using mini-batch k-means, which scales to millions of documents. The centroids are initialised on a random sample of the documents and then updated with partial_fit over chunks of batch_size documents, so only one chunk is copied at a time. If cache_dir is given, the result is persisted and reused for the same embeddings
+
+    Parameters
+    ----------
+    embeddings : numpy array
+        A numpy array of shape (n_features, n_documents), e.g. memory-mapped from a space store
+    n_clusters : int
+        The number of clusters. Capped at the number of documents. Default is 8
+    batch_size : int
+        The number of documents per mini-batch. Default is 4096
+    n_epochs : int
+        The number of passes over all documents after the initialisation. Default is 1
+    random_state : int
+        Seed for the initialisation and the mini-batches. Default is 0
+    cache_dir : str or Path
+        Directory to persist the clustering in. Default is None (no caching)
+
+    Returns
+    -------
+    kmeans : MiniBatchKMeans object
+        The fitted clustering with the centroids in cluster_centers_
+    labels : numpy array
+        The cluster of each document
+    distances : numpy array
+        The distance of each document to the centroid of its cluster
+    """
+    if cache_dir is not None:
+        import joblib
+
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_file = cache_dir / f"{embedding_hash(embeddings)}_kmeans_{n_clusters}_{random_state}.joblib"
+
+        if cache_file.exists():
+            return joblib.load(cache_file)
+
+    from sklearn.cluster import MiniBatchKMeans
+
+    embeddings = np.asarray(embeddings)
+    n_documents = embeddings.shape[1]
+    rng = np.random.default_rng(random_state)
+    starts = np.arange(0, n_documents, batch_size)
+
+    kmeans = MiniBatchKMeans(n_clusters=min(n_clusters, n_documents), batch_size=batch_size, n_init=3, random_state=random_state)
+
+    # initialise on a random sample of the size MiniBatchKMeans uses for its initialisation
+    sample = np.sort(rng.choice(n_documents, size=min(n_documents, 3 * batch_size), replace=False))
+    kmeans.fit(_documents(embeddings, sample))
+
+    for _ in range(n_epochs):
+        for start in rng.permutation(starts):
+            kmeans.partial_fit(_documents(embeddings, slice(start, start + batch_size)))
+
+    labels = np.empty(n_documents, dtype=np.int32)
+    distances = np.empty(n_documents, dtype=np.float32)
+    for start in starts:
+        centroid_distances = kmeans.transform(_documents(embeddings, slice(start, start + batch_size)))
+        labels[start:start + batch_size] = centroid_distances.argmin(axis=1)
+        distances[start:start + batch_size] = centroid_distances.min(axis=1)
+
+    if cache_dir is not None:
+        dump_atomic((kmeans, labels, distances), cache_file)
+
+    return kmeans, labels, distances
+
+
+def cluster_summary(df, labels, distances, author_col = "author", title_col = "title", n_titles = 3):
+    """
+    Summarises each cluster by its size, most common author and the titles closest to its centroid
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        The dataframe of the documents
+    labels : numpy array
+        The cluster of each document
+    distances : numpy array
+        The distance of each document to the centroid of its cluster
+    author_col : str
+        The name of the column containing the author names
+    title_col : str
+        The name of the column containing the titles
+    n_titles : int
+        The number of titles to show per cluster
+
+    Returns
+    -------
+    summary : pandas dataframe
+        A dataframe with one row per cluster
+    """
+    data = pd.DataFrame({
+        "cluster": labels,
+        "distance": distances,
+        "author": df[author_col].values,
+        "title": df[title_col].values
+        })
+
+    rows = []
+    for cluster, group in data.groupby("cluster"):
+        rows.append({
+            "cluster": cluster,
+            "size": len(group),
+            "top author": group["author"].value_counts().index[0],
+            "central titles": ", ".join(group.nsmallest(n_titles, "distance")["title"]),
+        })
+
+    return pd.DataFrame(rows)
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def estimate_nbytes(obj):
+    """
+    Estimates the memory footprint of a loaded corpus in bytes. Dataframes and numpy arrays are counted once, even if they are shared between several TextSpaceData objects
+
+    Parameters
+    ----------
+    obj : object
+        The object to estimate the size of. Dicts, lists and TextSpaceData objects are searched recursively
+
+    Returns
+    -------
+    nbytes : int
+        The estimated size in bytes
+    """
+    seen = set()
+
+    def _nbytes(o):
+        if id(o) in seen:
+            return 0
+        seen.add(id(o))
+
+        if isinstance(o, pd.DataFrame):
+            return int(o.memory_usage(deep=True).sum())
+        if isinstance(o, np.ndarray):
+            # memory-mapped arrays live in the page cache and are not counted
+            return 0 if isinstance(o, np.memmap) else o.nbytes
+        if hasattr(o, "to_plotly_json"):
+            # plotly figures are approximated by their serialised size
+            return len(o.to_json())
+        if isinstance(o, dict):
+            return sum(_nbytes(v) for v in o.values())
+        if isinstance(o, (list, tuple)):
+            return sum(_nbytes(v) for v in o)
+        if hasattr(o, "__dict__"):
+            return sum(_nbytes(v) for v in vars(o).values())
+        return 0
+
+    return _nbytes(obj)
+
+
+class CorpusCache:
+    def __init__(self, loader, max_bytes = 1024**3):
+        """
+        Least-recently-used cache of loaded corpora with a memory budget. Corpora are loaded on demand and the least recently viewed corpora are evicted when the budget is exceeded
+
+        Parameters
+        ----------
+        loader : callable
+            Function taking the name of a corpus and returning the loaded corpus
+        max_bytes : int
+            The memory budget in bytes. The most recently viewed corpus is always kept, even if it alone exceeds the budget. Default is 1 GB
+        """
+        self.loader = loader
+        self.max_bytes = max_bytes
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+        self.metrics = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0, "load_seconds": 0.0}
+
+    def get(self, name):
+        """
+        Returns the corpus with the given name, loading it if it is not in the cache
+
+        Parameters
+        ----------
+        name : str
+            The name of the corpus
+
+        Returns
+        -------
+        corpus : object
+            The loaded corpus
+        """
+        with self._lock:
+            if name in self._cache:
+                self._cache.move_to_end(name)
+                self.metrics["hits"] += 1
+                return self._cache[name][0]
+
+            self.metrics["misses"] += 1
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # load outside of the cache lock so other corpora can still be served
+        with load_lock:
+            try:
+                with self._lock:
+                    if name in self._cache:
+                        self._cache.move_to_end(name)
+                        return self._cache[name][0]
+
+                start = time.perf_counter()
+                corpus = self.loader(name)
+                load_seconds = time.perf_counter() - start
+                nbytes = estimate_nbytes(corpus)
+
+                with self._lock:
+                    self._cache[name] = (corpus, nbytes)
+                    self.metrics["loads"] += 1
+                    self.metrics["load_seconds"] += load_seconds
+                    self._evict()
+            finally:
+                # threads still waiting on the lock find the corpus in the cache, later misses create a new lock
+                with self._lock:
+                    if self._load_locks.get(name) is load_lock:
+                        del self._load_locks[name]
+
+        return corpus
+
+    def _evict(self):
+        """
+        Evicts the least recently viewed corpora until the cache is within the memory budget. Must be called with the cache lock held
+        """
+        while len(self._cache) > 1 and self.nbytes > self.max_bytes:
+            self._cache.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def discard(self, name):
+        """
+        Removes a corpus from the cache, e.g. if the underlying data has changed
+        """
+        with self._lock:
+            self._cache.pop(name, None)
+
+    @property
+    def nbytes(self):
+        return sum(nbytes for _, nbytes in self._cache.values())
+
+    def __contains__(self, name):
+        return name in self._cache
+
+    def stats(self):
+        """
+        Returns the cache metrics together with the currently loaded corpora
+        """
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["loaded"] = list(self._cache.keys())
+            stats["nbytes"] = self.nbytes
+            stats["max_bytes"] = self.max_bytes
+
+        return stats
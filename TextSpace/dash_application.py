@@ -1,20 +1,27 @@
-from dash import Dash, html, dcc, Output, Input
+from dash import Dash, html, dcc, Output, Input, State, ALL, ctx
+from flask import jsonify
 import dash_bootstrap_components as dbc
 from dash_bootstrap_templates import load_figure_template
 import pandas as pd
 
 from plot3D import plot_embeddings_3d
 from data import TextSpaceData
+from corpus_cache import CorpusCache
+from store import EMBEDDING_TYPES, is_space_store, load_spaces
+from jobs import JobQueue, read_header, validate_table
 from pathlib import Path
+import base64
 
-def prep_data_dash(data_path:Path):
+def prep_data_dash(data_path:Path, n_clusters=8):
     """
-    Prepares the data for the dash app by creating a dictionary of TextSpaceData objects
+    Prepares the data for the dash app by creating a dictionary of TextSpaceData objects with their clusters
 
     Parameters
     ----------
     data_path : str
         Path to the data file
+    n_clusters : int
+        The number of clusters computed for each space. Default is 8
     
     Returns
     -------
@@ -28,58 +35,151 @@ def prep_data_dash(data_path:Path):
 
     TextSpace_dict = {}
 
-    for embedding_type in ["emotion", "gpt2", "bow", "topic"]:
+    for embedding_type in EMBEDDING_TYPES:
         # create TextSpaceData object
         TextSpace_dict[embedding_type] = TextSpaceData(df, embedding_type=embedding_type)
+        TextSpace_dict[embedding_type].get_clusters(n_clusters)
 
     return TextSpace_dict
 
-def dropdown_options(TextSpace_dict):
+def find_corpora(data_path:Path):
+    """
+    Finds the corpora available to the dash app
+
+    Parameters
+    ----------
+    data_path : str
+        Path to a single data file or space store, or to a directory containing a data file or space store per corpus
+
+    Returns
+    -------
+    corpora : dict
+        Dictionary mapping corpus names to data files or space stores
+    """
+    data_path = Path(data_path)
+
+    if is_space_store(data_path):
+        files = [data_path]
+    elif data_path.is_dir():
+        # hidden directories are space stores that are still being written
+        files = sorted(data_path.glob("*.csv")) + sorted(path for path in data_path.iterdir() if is_space_store(path) and not path.name.startswith("."))
+    else:
+        files = [data_path]
+
+    return {file.stem: file for file in files}
+
+def load_corpus(data_path, n_clusters=8):
+    """
+    Loads a corpus for the dash app by creating its figures and cluster summaries. Space stores written by store.save_spaces are memory-mapped, so loading a corpus never computes embeddings
+
+    Parameters
+    ----------
+    data_path : str, Path or dict
+        Path to the space store, or the TextSpaceData objects of a corpus built with prep_data_dash
+    n_clusters : int
+        The number of clusters computed for each space. Default is 8
+
+    Returns
+    -------
+    corpus : dict
+        Dictionary with the TextSpaceData objects under 'spaces', the figures per colouring under 'figures' and the cluster summaries under 'summaries'
+    """
+    if isinstance(data_path, dict):
+        TextSpace_dict = data_path
+    else:
+        TextSpace_dict = load_spaces(data_path)
+
+    figures = {
+        "author": dict_plot_embeddings_3d(TextSpace_dict),
+        "cluster": dict_plot_embeddings_3d(TextSpace_dict, color_by="cluster", n_clusters=n_clusters)
+    }
+    summaries = {embedding_type: space.get_cluster_summary(n_clusters) for embedding_type, space in TextSpace_dict.items()}
+
+    return {"spaces": TextSpace_dict, "figures": figures, "summaries": summaries}
+
+def dropdown_options(values):
     """
     Returns the dropdown options for the dash app
     """
 
     options = []
-    for embedding_type in TextSpace_dict.keys():
-        options.append({'label': embedding_type, 'value': embedding_type})
+    for value in values:
+        options.append({'label': value, 'value': value})
 
     return options
 
-def dict_plot_embeddings_3d(TextSpace_dict):
+def dict_plot_embeddings_3d(TextSpace_dict, color_by="author", n_clusters=8):
     """
-    
+    Returns a dictionary with a figure for each TextSpaceData object, coloured by author or cluster
     """
     plot_dict = {}
     for embedding_type in TextSpace_dict.keys():
-        fig = plot_embeddings_3d(TextSpace_dict[embedding_type])
+        fig = plot_embeddings_3d(TextSpace_dict[embedding_type], color_by=color_by, n_clusters=n_clusters)
         plot_dict[embedding_type] = fig
 
     return plot_dict
 
-def get_dash_app(data_path=None):
+def get_dash_app(data_path=None, corpora=None, max_memory_mb=1024, warm=False, n_clusters=8, jobs_dir=None, job_workers=1):
     """
-    Returns a Dash app for the project
+    Returns a Dash app for the project. Corpora are loaded when they are first selected and kept in a least-recently-used cache, so one server can expose many corpora. Cache metrics are available at /metrics
+
+    Only space stores are loaded on a request. Data files are embedded as background jobs if jobs_dir is given, and appear when they are done. Otherwise they are embedded when the app is created, and only their figures are rebuilt after an eviction
 
     Parameters
     ----------
     data_path : str
-        Path to the data file
+        Path to the data file or to a directory with a data file per corpus
+    corpora : dict
+        Dictionary mapping corpus names to data files or space stores. Used instead of data_path if given
+    max_memory_mb : int
+        Memory budget of the corpus cache in megabytes. Default is 1024
+    warm : bool
+        Whether to load the corpora when the app is created instead of on first view. When served with `gunicorn --preload` this happens once in the master process and the workers inherit the loaded corpora. Default is False
+    n_clusters : int
+        The number of clusters the points can be coloured by. Default is 8
+    jobs_dir : str or Path
+        If given, an upload panel is added. The spaces of uploaded corpora are built as background jobs, which are kept in this directory, and appear in the corpus dropdown when they are done. Default is None (no uploads)
+    job_workers : int
+        The number of worker processes building the spaces of uploaded corpora. Default is 1
 
     Returns
     -------
     app : Dash app
         Dash app for the project
     """
-    TextSpaceData_dict = prep_data_dash(data_path)
+    if corpora is None:
+        corpora = find_corpora(data_path) if data_path is not None else {}
+
+    # data files are embedded here or as jobs, so the request threads only load space stores
+    data_files = {name: path for name, path in corpora.items() if not is_space_store(path)}
+    corpora = {name: path for name, path in corpora.items() if name not in data_files}
+
+    job_queue = None
+    if jobs_dir is not None:
+        job_queue = JobQueue(jobs_dir, max_workers=job_workers, n_clusters=n_clusters)
+        corpora.update(find_corpora(job_queue.store_dir))
+
+        active = job_queue.active_names()
+        for name, path in data_files.items():
+            if name not in corpora and name not in active:
+                job_queue.submit(name, path)
+    else:
+        for name, path in data_files.items():
+            corpora[name] = prep_data_dash(path, n_clusters=n_clusters)
+
+    if len(corpora) == 0 and job_queue is None:
+        raise ValueError(f"No corpora found in '{data_path}'")
+
+    corpus_cache = CorpusCache(lambda name: load_corpus(corpora[name], n_clusters=n_clusters), max_bytes=max_memory_mb * 1024**2)
+
+    if warm:
+        for name in corpora.keys():
+            corpus_cache.get(name)
     
     load_figure_template("LUX")
 
-    # dropdown options
-    options = dropdown_options(TextSpaceData_dict)
-
-    # create figures
-    plot_dict = dict_plot_embeddings_3d(TextSpaceData_dict)
-
+    # dropdown options. The embedding types are filled in from the spaces of the selected corpus
+    corpus_options = dropdown_options(corpora.keys())
 
     app = Dash(external_stylesheets=[dbc.themes.LUX])
 
@@ -95,14 +195,25 @@ def get_dash_app(data_path=None):
 
     sidebar = html.Div(
         [
+            html.H4("Corpus"),
+            html.Hr(),
+
+            dcc.Dropdown(id="corpus",
+                options=corpus_options,
+                value=corpus_options[0]['value'] if len(corpus_options) > 0 else None,
+                clearable=False,
+                style={'width': '100%'}
+            ),
+
+            html.Hr(style={"border-top": "1px solid #ABD699"}),
             html.H4("Embedding type"),
             html.Hr(),
 
             dbc.Nav(
                 [
                     dcc.Dropdown(id="embedding-type",
-                        options=options,
-                        value=options[0]['value'],
+                        options=[],
+                        value=None,
                         clearable=False,
                         style={'width': '100%'}
                     ),
@@ -111,6 +222,17 @@ def get_dash_app(data_path=None):
                 pills=True,
             ),
 
+            html.Hr(style={"border-top": "1px solid #ABD699"}),
+            html.H4("Colour by"),
+            html.Hr(),
+
+            dcc.RadioItems(id="color-by",
+                options=dropdown_options(["author", "cluster"]),
+                value="author",
+                inline=True,
+                inputStyle={"margin-left": "1rem", "margin-right": "0.5rem"}
+            ),
+
             # padding no line
             html.Hr(style={"border-top": "1px solid #ABD699"}),
             # include text area
@@ -123,13 +245,31 @@ def get_dash_app(data_path=None):
                         value="Click on a point to view the text",
                         readOnly=True,
                         draggable=True,
-                        style={'width': '100%', 'height': 500}
+                        style={'width': '100%', 'height': 400}
                     )
                 ])
         ],
         style=SIDEBAR_STYLE,
     )
 
+    upload_panel = html.Div()
+    if job_queue is not None:
+        upload_panel = html.Div(
+            [
+                html.H4("Upload corpus"),
+                html.Hr(),
+                dcc.Upload(
+                    id="upload",
+                    children=html.Div(["Drag and drop or ", html.A("select a CSV or Parquet file")]),
+                    style={"width": "100%", "padding": "1rem", "border": "1px dashed", "text-align": "center"}
+                ),
+                html.Div(id="upload-message", style={"padding-top": "1rem"}),
+                html.Div(id="jobs"),
+                html.Div(id="cancel-message"),
+                dcc.Interval(id="job-interval", interval=2000)
+            ],
+            style={"padding-bottom": "2rem"}
+        )
 
     app.layout = html.Div([
         dbc.Row(
@@ -142,31 +282,83 @@ def get_dash_app(data_path=None):
         dbc.Row(
             [
                 dbc.Col(sidebar),
-                dbc.Col(dcc.Graph(id='3d-plot', figure={}), width=8)
+                dbc.Col([
+                    dcc.Graph(id='3d-plot', figure={}),
+                    html.Div(id='cluster-summary'),
+                    upload_panel
+                    ], width=8)
             ]
         ),
 
     ])
 
+    @app.callback(
+        Output('embedding-type', 'options'),
+        Output('embedding-type', 'value'),
+        Input('corpus', 'value'),
+        State('embedding-type', 'value')
+    )
+
+    def update_embedding_types(corpus, embedding_type):
+        # a store can hold only some of the embedding types
+        if corpus is None:
+            return [], None
+
+        embedding_types = list(corpus_cache.get(corpus)["spaces"].keys())
+        if embedding_type not in embedding_types:
+            embedding_type = embedding_types[0]
+
+        return dropdown_options(embedding_types), embedding_type
+
     @app.callback(
         Output('3d-plot', 'figure'),
-        Input('embedding-type', 'value')
+        Input('corpus', 'value'),
+        Input('embedding-type', 'value'),
+        Input('color-by', 'value')
     )
 
-    def update_plot(embedding_type):
-        return plot_dict[embedding_type]
+    def update_plot(corpus, embedding_type, color_by):
+        if corpus is None:
+            return {}
+
+        figures = corpus_cache.get(corpus)["figures"][color_by]
+        if embedding_type not in figures:
+            return {}
+        return figures[embedding_type]
+
+    @app.callback(
+        Output('cluster-summary', 'children'),
+        Input('corpus', 'value'),
+        Input('embedding-type', 'value'),
+        Input('color-by', 'value')
+    )
+
+    def update_summary(corpus, embedding_type, color_by):
+        if color_by != "cluster" or corpus is None:
+            return []
+
+        summaries = corpus_cache.get(corpus)["summaries"]
+        if embedding_type not in summaries:
+            return []
+
+        summary = summaries[embedding_type]
+        return dbc.Table.from_dataframe(summary, striped=True, bordered=False, hover=True, size="sm")
 
     @app.callback(
         Output('text-area', 'value'),
-        Input('3d-plot', 'clickData')
+        Input('3d-plot', 'clickData'),
+        State('corpus', 'value'),
+        State('embedding-type', 'value')
     )
 
-    def update_text(clickData):
-        if clickData is None:
+    def update_text(clickData, corpus, embedding_type):
+        TextSpaceData_dict = corpus_cache.get(corpus)["spaces"] if corpus is not None else {}
+
+        if clickData is None or embedding_type not in TextSpaceData_dict:
             return "Click on a point to see the text"
         else:
-            df = TextSpaceData_dict["emotion"].df
-            text_col = TextSpaceData_dict["emotion"].text_col
+            df = TextSpaceData_dict[embedding_type].df
+            text_col = TextSpaceData_dict[embedding_type].text_col
 
             title = clickData['points'][0]["text"]
             # get the full text
@@ -174,6 +366,82 @@ def get_dash_app(data_path=None):
 
             return_text = title + "\n\n" + full_text
             return return_text
+
+    if job_queue is not None:
+        @app.callback(
+            Output('upload-message', 'children'),
+            Input('upload', 'contents'),
+            State('upload', 'filename')
+        )
+
+        def upload(contents, filename):
+            if contents is None:
+                return []
+
+            # contents is a data url: "data:<type>;base64,<content>"
+            content = base64.b64decode(contents.split(",", 1)[1])
+            data_path = job_queue.save_upload(filename, content)
+
+            # only the columns are checked here, the NaN values are checked by the job, which reports them as a failure
+            try:
+                validate_table(read_header(data_path))
+            except Exception as e:
+                data_path.unlink()
+                return dbc.Alert(f"{filename} was not uploaded: {e}", color="danger")
+
+            # uploads never take the name of a served or pending corpus
+            job_queue.submit(Path(filename).stem, data_path, reserved_names=set(corpora.keys()) | set(data_files.keys()))
+
+            return dbc.Alert(f"{filename} was uploaded and is being embedded", color="success")
+
+        @app.callback(
+            Output('jobs', 'children'),
+            Output('corpus', 'options'),
+            Input('job-interval', 'n_intervals'),
+            Input('upload-message', 'children'),
+            Input('cancel-message', 'children')
+        )
+
+        def update_jobs(n_intervals, upload_message, cancel_message):
+            # finished spaces appear in the dropdown without a restart. A name that now points to another
+            # store is dropped from the cache, so the old version is not served any longer
+            for name, path in find_corpora(job_queue.store_dir).items():
+                if corpora.get(name) != path:
+                    corpora[name] = path
+                    corpus_cache.discard(name)
+
+            rows = []
+            for job in job_queue.list_jobs():
+                active = job["status"] in ["queued", "running"]
+                rows.append(dbc.Row(
+                    [
+                        dbc.Col(job["name"], width=3),
+                        dbc.Col(f"{job['status']}: {job['message']}", width=4),
+                        dbc.Col(dbc.Progress(value=100 * job["progress"], animated=active, striped=active), width=3),
+                        dbc.Col(dbc.Button("Cancel", id={"type": "cancel-job", "index": job["id"]}, size="sm", color="secondary") if active else [], width=2)
+                    ],
+                    style={"padding-bottom": "0.5rem"}
+                ))
+
+            return rows, dropdown_options(corpora.keys())
+
+        @app.callback(
+            Output('cancel-message', 'children'),
+            Input({"type": "cancel-job", "index": ALL}, 'n_clicks'),
+            prevent_initial_call=True
+        )
+
+        def cancel_job(n_clicks):
+            # the buttons are re-rendered with every update, which also triggers this callback
+            if ctx.triggered_id is None or ctx.triggered[0]["value"] is None:
+                return []
+
+            job_queue.cancel(ctx.triggered_id["index"])
+            return []
+
+    @app.server.route('/metrics')
+    def metrics():
+        return jsonify(corpus_cache.stats())
     
     return app
         
@@ -1,12 +1,35 @@
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from sklearn.decomposition import PCA
+
+from reducers import reduce_embeddings
+from topics import TopicEngine
+from dedup import find_near_duplicates, dedup_report
+from clusters import fit_clusters, cluster_summary
+import gpt2
+
+
+def check_col(df, col):
+    """
+    Checks that the dataframe has the column and that it does not contain NaN values
+
+    Raises
+    ------
+    ValueError
+        If the dataframe does not contain the column or if the column contains NaN values
+    """
+    if col not in df.columns:
+        raise ValueError(f"Column '{col}' not in dataframe")
+    
+    if df[col].isnull().values.any():
+        raise ValueError(f"Column '{col}' contains NaN values")
 
 # data class for TextSpace
 class TextSpaceData:
-    def __init__(self, df, author_col = "author", text_col = "text_full", title_col = "title", embedding_type = "gpt2"):
+    def __init__(self, df, author_col = "author", text_col = "text_full", title_col = "title", embedding_type = "gpt2", reducer = "pca", random_state = 0, cache_dir = None, embeddings = None, coords = None, topic_engine = None, deduplicate = False, dedup_threshold = 0.9, gpt2_workers = 1, gpt2_threads = None, gpt2_layer = -1, gpt2_pooling = "mean"):
         """
-        The TextSpaceData class is used to prepare data for the TextSpace visualization. It takes a dataframe as input and prepares it for the visualization by extracting the embeddings and performing PCA on them.
+        The TextSpaceData class is used to prepare data for the TextSpace visualization. It takes a dataframe as input and prepares it for the visualization by extracting the embeddings and reducing them to 3 dimensions.
 
         Parameters
         ----------
@@ -20,6 +43,30 @@ class TextSpaceData:
             The name of the column containing the titles. Default is "title"
         embedding_type : str
             The type of embeddings to use. Either 'gpt2', 'emotion', 'topic' or 'bow'. Default is 'gpt2'
+        reducer : str
+            The dimensionality reduction to use. Either 'pca', 'pca_randomized', 'pca_arpack', 'svd' or 'tsne'. Default is 'pca'
+        random_state : int
+            Seed used for the dimensionality reduction. Default is 0
+        cache_dir : str or Path
+            Directory to persist fitted reducers in, so repeated builds on the same embeddings reuse them. Default is None (no caching)
+        embeddings : numpy array
+            Precomputed embeddings of shape (n_features, n_documents), e.g. loaded from a space store. Default is None (embeddings are computed)
+        coords : numpy array
+            Precomputed 3d coordinates of shape (n_documents, 3). If given, no reducer is fitted. Default is None
+        topic_engine : TopicEngine or str or Path
+            The topic model used for the 'topic' embeddings. A fitted TopicEngine is only used to project the texts, an unfitted one is fitted first. If a path is given, the topic engine saved there is loaded, or if it does not exist a TopicEngine with default settings is fitted and saved there. Default is None (a TopicEngine with default settings is fitted)
+        deduplicate : bool
+            Whether to detect near-duplicate texts with MinHash/LSH before embedding. Only one representative of each group of near-duplicates is embedded and its embedding is reused for the duplicates. Default is False
+        dedup_threshold : float
+            The estimated Jaccard similarity of the word shingles above which two texts are near-duplicates. Default is 0.9
+        gpt2_workers : int
+            The number of worker processes the GPT2 inference is sharded across. Default is 1
+        gpt2_threads : int
+            The number of torch threads per GPT2 worker. Default is None (torch's default for one worker, the cores divided evenly between several workers)
+        gpt2_layer : int
+            The GPT2 layer the embeddings are extracted from. 0 is the token embeddings and -1 (or 12) the final layer. Later layers are not computed. Default is -1
+        gpt2_pooling : str
+            How the token vectors of a text are pooled. Either 'mean', 'last' (last token) or 'max'. Padding is ignored. Default is 'mean'
         
         Raises
         ------
@@ -31,69 +78,63 @@ class TextSpaceData:
         self.text_col = text_col
         self.title_col = title_col
         self.embedding_type = embedding_type
+        self.reducer_type = reducer
+        self.random_state = random_state
+        self.cache_dir = cache_dir
+        self.topic_engine = topic_engine
+        self.gpt2_workers = gpt2_workers
+        self.gpt2_threads = gpt2_threads
+        self.gpt2_layer = gpt2_layer
+        self.gpt2_pooling = gpt2_pooling
 
         # check that the dataframe has the correct columns
         for col in [self.author_col, self.text_col, self.title_col]:
             self._check_col(col)
 
-        # prepare pca components for plotly visualization
-        self.pca = self.get_pca(self.embedding_type)
+        # find near-duplicates, so only the representative texts are embedded
+        if deduplicate:
+            self.representatives = find_near_duplicates(self.df[self.text_col], threshold=dedup_threshold)
+        else:
+            self.representatives = np.arange(len(self.df))
+        self.dedup_report = dedup_report(self.representatives)
+
+        # clusterings are computed on demand and kept per number of clusters
+        self.clusters = {}
+
+        # prepare 3d coordinates for plotly visualization
+        if embeddings is None:
+            embeddings = self.get_embeddings(self.embedding_type)
+        self.embeddings = embeddings
+
+        if coords is None:
+            self.reducer, self.coords = self.get_reduction(self.embeddings)
+        else:
+            self.reducer, self.coords = None, coords
 
     def _check_col(self, col):
         """
         Checks that the dataframe has the correct columns
         """
-        if col not in self.df.columns:
-            raise ValueError(f"Column '{col}' not in dataframe")
-        
-        if self.df[col].isnull().values.any():
-            raise ValueError(f"Column '{col}' contains NaN values")
+        check_col(self.df, col)
+
+    def _texts(self):
+        """
+        Returns the texts to embed, which are the representatives of the near-duplicate groups
+        """
+        return self.df[self.text_col].iloc[np.unique(self.representatives)]
     
 
     def get_gpt2_embeddings(self):
         """
-        Gets the embeddings for a list of texts using GPT2 model
+        Gets the embeddings for a list of texts using GPT2 model, pooling the tokens of gpt2_layer with gpt2_pooling. The inference is sharded across gpt2_workers processes
 
         Returns
         -------
         embeddings : numpy array
             A numpy array containing the embeddings for the texts
         """
-        # import gpt2 tokenizer and model
-        from transformers import GPT2Tokenizer, GPT2Model
-        from tensorflow.keras.preprocessing.sequence import pad_sequences
-        import torch
-
-        # load tokenizer and model
-        tokenizer = GPT2Tokenizer.from_pretrained('gpt2')
-        model = GPT2Model.from_pretrained('gpt2')
-
-        tokenized_txts = [tokenizer.encode(text, truncation=True) for text in self.df[self.text_col]]
-
-        embeddings = []
-
-        # loop through tokenized texts and get their embeddings
-        for txt in tokenized_txts:
-            # pad sequence with max length of 1024
-            txts_padded = pad_sequences([txt], maxlen=1024)
-
-            # convert to torch tensor
-            txts_padded = torch.tensor(txts_padded)
-
-            # attention mask
-            attention_mask = torch.where(txts_padded != 0, 1, 0)
-
-            # get embedding
-            embedding = model(input_ids=txts_padded, attention_mask = attention_mask, return_dict=True, output_hidden_states=True)
-
-            # get last layer of embeddings (last hidden state)
-            embedding = embedding.hidden_states[-1][:,0,:].detach().numpy().squeeze()
-
-            # append to list of embeddings
-            embeddings.append(embedding)
-
-        # convert list of embeddings to numpy array
-        embeddings = np.array(embeddings)
+        embeddings = gpt2.get_gpt2_embeddings(self._texts(), n_workers=self.gpt2_workers, n_threads=self.gpt2_threads,
+                                              layer=self.gpt2_layer, pooling=self.gpt2_pooling)
 
         return embeddings.transpose()
     
@@ -110,7 +151,7 @@ class TextSpaceData:
         emotion_labels = ['neutral', 'disgust', 'anger', 'fear', 'sadness', 'joy', 'surprise']
         data = pd.DataFrame(columns = emotion_labels)
 
-        for i, txt in enumerate(self.df[self.text_col]):
+        for i, txt in enumerate(self._texts()):
             emotion_scores = nlp(txt[:512])
 
             # get emotion scores
@@ -137,7 +178,7 @@ class TextSpaceData:
         vectorizer = CountVectorizer()
 
         # fit and transform texts
-        embeddings = vectorizer.fit_transform(self.df[self.text_col])
+        embeddings = vectorizer.fit_transform(self._texts())
 
         # convert to numpy array
         embeddings = embeddings.toarray()
@@ -146,49 +187,47 @@ class TextSpaceData:
     
     def get_topic_embeddings(self):
         """
-        Gets the embeddings for a list of texts using topic modelling
+        Gets the embeddings for a list of texts using topic modelling. The fitted topic engine is stored in self.topic_engine so new documents can be projected without refitting
 
         Returns
         -------
         embeddings : numpy array
             A numpy array containing the embeddings for the texts
         """
-        from sklearn.feature_extraction.text import CountVectorizer
-        from sklearn.decomposition import LatentDirichletAllocation
-
-        # initialize count vectorizer
-        vectorizer = CountVectorizer()
+        texts = self._texts()
 
-        # fit and transform texts
-        embeddings = vectorizer.fit_transform(self.df[self.text_col])
+        if isinstance(self.topic_engine, (str, Path)):
+            model_path = Path(self.topic_engine)
 
-        # initialize lda
-        lda = LatentDirichletAllocation(n_components=12)
+            if model_path.exists():
+                self.topic_engine = TopicEngine.load(model_path)
+            else:
+                self.topic_engine = TopicEngine().fit(texts)
+                self.topic_engine.save(model_path)
+        elif self.topic_engine is None:
+            self.topic_engine = TopicEngine()
 
-        # fit lda
-        lda.fit(embeddings)
+        if self.topic_engine.lda is None:
+            self.topic_engine.fit(texts)
 
         # get embeddings
-        embeddings = lda.transform(embeddings)
-
+        embeddings = self.topic_engine.transform(texts)
 
         return embeddings.transpose()
     
-    def get_pca(self, embedding_type, n_components = 3):
+    def get_embeddings(self, embedding_type):
         """
-        Performs PCA on the embeddings
+        Gets the embeddings of the specified type. Near-duplicates get the embedding of their representative
 
         Parameters
         ----------
         embedding_type : str
-            The type of embeddings to use. Either 'gpt2' or 'emotion'
-        n_components : int
-            The number of components to keep
+            The type of embeddings to use. Either 'gpt2', 'emotion', 'bow' or 'topic'
 
         Returns
         -------
-        pca : PCA object
-            A PCA object
+        embeddings : numpy array
+            A numpy array of shape (n_features, n_documents)
         """
         if embedding_type == "gpt2":
             embeddings = self.get_gpt2_embeddings()
@@ -200,23 +239,125 @@ class TextSpaceData:
             embeddings = self.get_topic_embeddings()
         else:
             raise ValueError("embedding_type must be either 'gpt2', 'emotion', 'bow' or 'topic'")
-        
-        pca = PCA(n_components = n_components)
-        pca.fit(embeddings)
 
-        return pca
+        # expand the embeddings of the representatives to all documents
+        _, inverse = np.unique(self.representatives, return_inverse=True)
+        embeddings = np.asarray(embeddings)[:, inverse]
+
+        return embeddings
+
+    def get_reduction(self, embeddings, n_components = 3):
+        """
+        Reduces the embeddings to n_components dimensions using the reducer specified when initialising the object
+
+        Parameters
+        ----------
+        embeddings : numpy array
+            A numpy array of shape (n_features, n_documents)
+        n_components : int
+            The number of components to keep
+
+        Returns
+        -------
+        reducer : object
+            The fitted reducer
+        coords : numpy array
+            A numpy array of shape (n_documents, n_components)
+        """
+        return reduce_embeddings(np.asarray(embeddings, dtype=float), method=self.reducer_type, n_components=n_components, 
+                                 random_state=self.random_state, cache_dir=self.cache_dir)
     
-    def get_plot_data(self):
+    def get_pca(self, embedding_type = None, n_components = 3):
+        """
+        Performs PCA on the embeddings. Kept for code written against earlier versions, which used PCA for the 3d coordinates. New code should use get_reduction
+
+        Parameters
+        ----------
+        embedding_type : str
+            The type of embeddings to use. Default is None (the embeddings of this object)
+        n_components : int
+            The number of components to keep
+
+        Returns
+        -------
+        pca : PCA object
+            A PCA object
+        """
+        if embedding_type is None or embedding_type == self.embedding_type:
+            embeddings = self.embeddings
+        else:
+            embeddings = self.get_embeddings(embedding_type)
+
+        pca, _ = reduce_embeddings(np.asarray(embeddings, dtype=float), method="pca", n_components=n_components,
+                                   random_state=self.random_state, cache_dir=self.cache_dir)
+
+        return pca
+
+    @property
+    def pca(self):
         """
-        Returns the dataframe with the pca components
+        The PCA of the embeddings, as set by earlier versions. The fitted reducer is returned if it is a PCA, otherwise the PCA is fitted on first access
+        """
+        if self.reducer_type == "pca" and self.reducer is not None:
+            return self.reducer
+
+        if getattr(self, "_pca", None) is None:
+            self._pca = self.get_pca()
+
+        return self._pca
+
+    def get_clusters(self, n_clusters = 8):
+        """
+        Clusters the documents in the full-dimensional embedding space with mini-batch k-means. The result is kept, so re-colouring and summaries do not refit the clustering
+
+        Parameters
+        ----------
+        n_clusters : int
+            The number of clusters
+
+        Returns
+        -------
+        kmeans : MiniBatchKMeans object
+            The fitted clustering with the centroids in cluster_centers_
+        labels : numpy array
+            The cluster of each document
+        distances : numpy array
+            The distance of each document to the centroid of its cluster
+        """
+        if n_clusters not in self.clusters:
+            self.clusters[n_clusters] = fit_clusters(self.embeddings, n_clusters=n_clusters, random_state=self.random_state, cache_dir=self.cache_dir)
+
+        return self.clusters[n_clusters]
+
+    def get_cluster_summary(self, n_clusters = 8):
+        """
+        Returns a dataframe summarising each cluster by its size, most common author and the titles closest to its centroid
+        """
+        _, labels, distances = self.get_clusters(n_clusters)
+
+        return cluster_summary(self.df, labels, distances, author_col=self.author_col, title_col=self.title_col)
+
+    def get_plot_data(self, n_clusters = None):
+        """
+        Returns the dataframe with the 3d coordinates
+
+        Parameters
+        ----------
+        n_clusters : int
+            If given, a 'cluster' column with the cluster of each document is added. Default is None
         """
         data = self.df.copy()
 
-        # add columns with pca components
-        new_dat = {"x": self.pca.components_[0], "y": self.pca.components_[1], "z": self.pca.components_[2]}
-        pca_data = pd.DataFrame(new_dat)
+        # add columns with the reduced coordinates
+        new_dat = {"x": self.coords[:, 0], "y": self.coords[:, 1], "z": self.coords[:, 2]}
+
+        if n_clusters is not None:
+            _, labels, _ = self.get_clusters(n_clusters)
+            # strings, so plotly uses a discrete colour scale
+            new_dat["cluster"] = [f"Cluster {label}" for label in labels]
+        coord_data = pd.DataFrame(new_dat)
 
-        data = pd.concat([data, pca_data], axis = 1)
+        data = pd.concat([data, coord_data], axis = 1)
 
         return data
 
@@ -0,0 +1,172 @@
+import re
+import zlib
+
+import numpy as np
+
+# Mersenne prime used for the universal hash functions of the MinHash signatures
+_PRIME = (1 << 31) - 1
+
+
+def shingle_hashes(text, k = 3):
+    """
+    Returns the hashes of the word k-grams (shingles) of a text
+
+    Parameters
+    ----------
+    text : str
+        The text to shingle
+    k : int
+        The number of words per shingle. Default is 3
+
+    Returns
+    -------
+    hashes : numpy array
+        A numpy array with the unique 31-bit hashes of the shingles
+    """
+    words = re.findall(r"\w+", text.lower())
+
+    if len(words) < k:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+
+    hashes = [zlib.crc32(shingle.encode()) & _PRIME for shingle in shingles]
+
+    return np.unique(np.array(hashes, dtype=np.uint64))
+
+
+def minhash_signatures(texts, num_perm = 128, k = 3, seed = 0):
+    """
+    Computes the MinHash signature of each text. The fraction of equal values in two signatures estimates the Jaccard similarity of the shingle sets of the texts
+
+    Parameters
+    ----------
+    texts : list
+        A list of strings
+    num_perm : int
+        The number of hash functions (length of the signatures). Default is 128
+    k : int
+        The number of words per shingle. Default is 3
+    seed : int
+        Seed for the hash functions. Default is 0
+
+    Returns
+    -------
+    signatures : numpy array
+        A numpy array of shape (n_texts, num_perm)
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+
+    for i, text in enumerate(texts):
+        hashes = shingle_hashes(text, k=k)
+        # a * x + b fits in 64 bits as both a and x are below 2**31
+        signatures[i] = ((np.outer(hashes, a) + b) % _PRIME).min(axis=0)
+
+    return signatures
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Chooses the number of LSH bands so that texts with a similarity around the threshold are likely to share a bucket. The bands have to divide num_perm
+
+    Parameters
+    ----------
+    num_perm : int
+        The length of the signatures
+    threshold : float
+        The Jaccard similarity above which texts are considered near-duplicates
+
+    Returns
+    -------
+    bands : int
+        The number of bands
+    """
+    candidates = [bands for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+
+    # the S-curve of LSH has its steepest point around (1 / bands) ** (1 / rows). Choosing it just below
+    # the threshold favours recall, false candidates are removed when the signatures are compared
+    below = [bands for bands in candidates if (1 / bands) ** (bands / num_perm) <= threshold]
+    if len(below) == 0:
+        return candidates[-1]
+
+    return min(below, key=lambda bands: threshold - (1 / bands) ** (bands / num_perm))
+
+
+def find_near_duplicates(texts, threshold = 0.9, num_perm = 128, k = 3, seed = 0):
+    """
+    Finds near-duplicate texts using MinHash and locality-sensitive hashing. Each text is only compared to the representatives sharing an LSH bucket with it, so the run time is linear in the number of texts
+
+    Parameters
+    ----------
+    texts : list
+        A list of strings
+    threshold : float
+        The estimated Jaccard similarity of the shingles above which two texts are near-duplicates. Default is 0.9
+    num_perm : int
+        The length of the MinHash signatures. Default is 128
+    k : int
+        The number of words per shingle. Default is 3
+    seed : int
+        Seed for the hash functions. Default is 0
+
+    Returns
+    -------
+    representatives : numpy array
+        A numpy array with the index of the representative of each text. The representative of a group of near-duplicates is its first text, and every text in the group is a near-duplicate of its representative. Groups are not chained, so if A~B and B~C but not A~C, C is not grouped with A
+    """
+    texts = list(texts)
+    signatures = minhash_signatures(texts, num_perm=num_perm, k=k, seed=seed)
+
+    bands = choose_bands(num_perm, threshold)
+    rows = num_perm // bands
+
+    representatives = np.arange(len(texts))
+    # the representatives of the texts in each bucket, per band
+    buckets = [{} for _ in range(bands)]
+
+    for i in range(len(texts)):
+        keys = [signatures[i, band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+
+        # verify the candidates against the full signatures and join the first representative that is a near-duplicate
+        candidates = sorted({j for band, key in enumerate(keys) for j in buckets[band].get(key, [])})
+        if len(candidates) > 0:
+            similarities = np.mean(signatures[candidates] == signatures[i], axis=1)
+            matches = np.flatnonzero(similarities >= threshold)
+            if len(matches) > 0:
+                representatives[i] = candidates[matches[0]]
+
+        for band, key in enumerate(keys):
+            bucket = buckets[band].setdefault(key, [])
+            if representatives[i] not in bucket:
+                bucket.append(representatives[i])
+
+    return representatives
+
+
+def dedup_report(representatives):
+    """
+    Summarises how much inference is saved by only embedding the representatives
+
+    Parameters
+    ----------
+    representatives : numpy array
+        The output of find_near_duplicates
+
+    Returns
+    -------
+    report : dict
+        Dictionary with the number of documents, unique documents, duplicates and the fraction of inference saved
+    """
+    n_documents = len(representatives)
+    n_unique = len(np.unique(representatives))
+
+    return {
+        "n_documents": n_documents,
+        "n_unique": n_unique,
+        "n_duplicates": n_documents - n_unique,
+        "inference_saved": (n_documents - n_unique) / n_documents if n_documents > 0 else 0.0,
+    }
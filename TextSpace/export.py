@@ -0,0 +1,159 @@
+import base64
+import html
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+def _encode(array, dtype):
+    """
+    Encodes an array as base64 little-endian bytes, which are decoded to a typed array in the browser
+    """
+    return base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode("ascii")
+
+
+def _script_json(obj):
+    """
+    Serialises an object as JSON that can be embedded in a script tag
+    """
+    return json.dumps(obj, ensure_ascii=False).replace("</", "<\\/")
+
+
+_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script type="text/javascript">{plotlyjs}</script>
+<style>
+body {{ font-family: serif; margin: 0; display: flex; }}
+#sidebar {{ width: 20rem; padding: 1rem; background-color: #ABD699; height: 100vh; box-sizing: border-box; }}
+#sidebar select {{ width: 100%; font-size: 1rem; }}
+#text {{ white-space: pre-wrap; overflow-y: auto; height: 70vh; }}
+#plot {{ flex: 1; height: 100vh; }}
+</style>
+</head>
+<body>
+<div id="sidebar">
+<h2>{title}</h2>
+<h4>Embedding type</h4>
+<select id="space"></select>
+<h4>Text</h4>
+<div id="text">Click on a point to view the text</div>
+</div>
+<div id="plot"></div>
+<script type="application/json" id="data">{data}</script>
+<script type="application/json" id="texts">{texts}</script>
+<script type="text/javascript">
+(function() {{
+    function decode(b64, Type) {{
+        var bin = atob(b64);
+        var bytes = new Uint8Array(bin.length);
+        for (var i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+        return new Type(bytes.buffer);
+    }}
+
+    var data = JSON.parse(document.getElementById("data").textContent);
+    var texts = null;
+    var codes = decode(data.author_codes, data.author_codes_bytes === 4 ? Uint32Array : Uint16Array);
+
+    // indices of the documents of each author, one trace per author
+    var groups = data.authors.map(function() {{ return []; }});
+    for (var i = 0; i < codes.length; i++) groups[codes[i]].push(i);
+
+    var select = document.getElementById("space");
+    Object.keys(data.spaces).forEach(function(name) {{
+        var option = document.createElement("option");
+        option.value = name;
+        option.text = name;
+        select.appendChild(option);
+    }});
+
+    var layout = {{
+        height: window.innerHeight,
+        font: {{family: "serif", size: 18}},
+        legend: {{title: {{text: data.author_title, font: {{size: 20}}}}, font: {{size: 16}}}},
+        hoverlabel: {{bgcolor: "white", font: {{size: 16, family: "serif"}}}},
+        scene: {{
+            xaxis: {{showbackground: false, showticklabels: false, title: ""}},
+            yaxis: {{showbackground: false, showticklabels: false, title: ""}},
+            zaxis: {{showbackground: false, showticklabels: false, title: ""}}
+        }},
+        margin: {{l: 0, r: 0, t: 0, b: 0}}
+    }};
+
+    function traces(name) {{
+        var coords = decode(data.spaces[name], Float32Array);
+        return groups.map(function(idx, g) {{
+            var x = new Float32Array(idx.length), y = new Float32Array(idx.length), z = new Float32Array(idx.length);
+            idx.forEach(function(doc, j) {{
+                x[j] = coords[3 * doc]; y[j] = coords[3 * doc + 1]; z[j] = coords[3 * doc + 2];
+            }});
+            return {{
+                type: "scatter3d", mode: "markers+text", name: data.authors[g],
+                x: x, y: y, z: z,
+                text: idx.map(function(doc) {{ return data.titles[doc]; }}),
+                textposition: "top center",
+                hovertemplate: "<b>%{{text}}</b><br><br><extra></extra>",
+                marker: {{color: data.colors[g % data.colors.length], opacity: 0.7}}
+            }};
+        }});
+    }}
+
+    var plot = document.getElementById("plot");
+    Plotly.newPlot(plot, traces(select.value), layout);
+    select.addEventListener("change", function() {{ Plotly.react(plot, traces(select.value), layout); }});
+
+    plot.on("plotly_click", function(event) {{
+        // the full texts are only parsed when they are first needed
+        if (texts === null) texts = JSON.parse(document.getElementById("texts").textContent);
+        var point = event.points[0];
+        var doc = groups[point.curveNumber][point.pointNumber];
+        document.getElementById("text").textContent = data.titles[doc] + "\\n\\n" + texts[doc];
+    }});
+}})();
+</script>
+</body>
+</html>
+"""
+
+
+def write_html_bundle(TextSpace_dict, path:Path, title="TextSpace"):
+    """
+    Writes all spaces of a corpus to a single self-contained HTML file with a dropdown to switch between them. plotly.js is included once, the coordinates are stored as base64-encoded float32 arrays and the full texts are only parsed when a point is clicked, which makes the file considerably smaller and faster to open than one plotly HTML file per space
+
+    Parameters
+    ----------
+    TextSpace_dict : dict
+        Dictionary of TextSpaceData objects with the embedding type as key. All objects must share the same dataframe
+    path : str or Path
+        Path of the HTML file
+    title : str
+        The title of the page. Default is 'TextSpace'
+    """
+    from plotly.offline import get_plotlyjs
+    from plotly.colors import qualitative
+
+    first = next(iter(TextSpace_dict.values()))
+    df = first.df
+
+    authors, author_codes = np.unique(df[first.author_col].astype(str), return_inverse=True)
+    # the codes go up to len(authors) - 1, which fits in two bytes for at most 65536 authors
+    author_dtype = "<u2" if len(authors) - 1 <= np.iinfo(np.uint16).max else "<u4"
+
+    data = {
+        "spaces": {embedding_type: _encode(space.coords[:, :3], "<f4") for embedding_type, space in TextSpace_dict.items()},
+        "authors": authors.tolist(),
+        "author_codes": _encode(author_codes, author_dtype),
+        "author_codes_bytes": np.dtype(author_dtype).itemsize,
+        "author_title": first.author_col,
+        "titles": df[first.title_col].astype(str).tolist(),
+        "colors": qualitative.Plotly,
+    }
+    texts = df[first.text_col].astype(str).tolist()
+
+    page = _TEMPLATE.format(title=html.escape(title), plotlyjs=get_plotlyjs(), data=_script_json(data), texts=_script_json(texts))
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(page)
@@ -0,0 +1,318 @@
+import os
+
+import numpy as np
+
+# model, tokenizer and embed_texts options of a worker process, set by _init_worker
+_worker_model = None
+_worker_tokenizer = None
+_worker_options = {}
+
+
+def load_gpt2():
+    """
+    Loads the GPT2 tokenizer and model
+
+    Returns
+    -------
+    tokenizer : GPT2Tokenizer
+        The GPT2 tokenizer
+    model : GPT2Model
+        The GPT2 model in evaluation mode
+    """
+    from transformers import GPT2Tokenizer, GPT2Model
+
+    tokenizer = GPT2Tokenizer.from_pretrained('gpt2')
+    model = GPT2Model.from_pretrained('gpt2')
+    model.eval()
+
+    return tokenizer, model
+
+
+POOLINGS = ["mean", "last", "max"]
+
+
+class _StopForward(Exception):
+    """
+    Raised by a forward hook to stop the forward pass once the requested layer has been computed
+    """
+    def __init__(self, hidden_state):
+        self.hidden_state = hidden_state
+
+
+def extract_layer(model, input_ids, attention_mask, layer = -1):
+    """
+    Returns the hidden states of one layer of GPT2 without keeping the activations of the other layers. For earlier layers the forward pass is stopped by a hook as soon as the layer has been computed
+
+    Parameters
+    ----------
+    model : GPT2Model
+        The GPT2 model
+    input_ids : torch tensor
+        Token ids of shape (batch_size, sequence_length)
+    attention_mask : torch tensor
+        Attention mask of shape (batch_size, sequence_length)
+    layer : int
+        The layer to extract, numbered as in output_hidden_states: 0 is the token and position embeddings and n_layer (or -1) is the final layer. Default is -1
+
+    Returns
+    -------
+    hidden_state : torch tensor
+        Hidden states of shape (batch_size, sequence_length, hidden_size)
+    """
+    n_layer = model.config.n_layer
+
+    if not -(n_layer + 1) <= layer <= n_layer:
+        raise ValueError(f"layer must be between {-(n_layer + 1)} and {n_layer}")
+    layer = layer % (n_layer + 1)
+
+    if layer == n_layer:
+        return model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False, return_dict=True).last_hidden_state
+
+    # layer 0 is the output of the embeddings, layer i the output of block i - 1
+    module = model.drop if layer == 0 else model.h[layer - 1]
+
+    def hook(module, inputs, output):
+        raise _StopForward(output[0] if isinstance(output, tuple) else output)
+
+    handle = module.register_forward_hook(hook)
+    try:
+        model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False, return_dict=True)
+    except _StopForward as stop:
+        return stop.hidden_state
+    finally:
+        handle.remove()
+
+
+def pool(hidden_state, attention_mask, pooling = "mean"):
+    """
+    Pools the hidden states of the tokens of each text into one vector, ignoring padding
+
+    Parameters
+    ----------
+    hidden_state : torch tensor
+        Hidden states of shape (batch_size, sequence_length, hidden_size)
+    attention_mask : torch tensor
+        Attention mask of shape (batch_size, sequence_length) for right-padded sequences
+    pooling : str
+        Either 'mean' (mean of the tokens), 'last' (last token) or 'max' (maximum over the tokens). Default is 'mean'
+
+    Returns
+    -------
+    embeddings : torch tensor
+        Embeddings of shape (batch_size, hidden_size)
+    """
+    import torch
+
+    mask = attention_mask.unsqueeze(-1).bool()
+
+    if pooling == "mean":
+        return (hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+    elif pooling == "last":
+        last = (attention_mask.sum(dim=1) - 1).clamp(min=0)
+        return hidden_state[torch.arange(hidden_state.shape[0]), last]
+    elif pooling == "max":
+        return hidden_state.masked_fill(~mask, float("-inf")).max(dim=1).values
+    else:
+        raise ValueError(f"pooling must be one of {POOLINGS}")
+
+
+def embed_texts(texts, tokenizer, model, layer = -1, pooling = "mean", batch_size = 8):
+    """
+    Gets the GPT2 embeddings of a list of texts
+
+    Parameters
+    ----------
+    texts : list
+        A list of strings
+    tokenizer : GPT2Tokenizer
+        The GPT2 tokenizer
+    model : GPT2Model
+        The GPT2 model
+    layer : int
+        The layer to extract. See extract_layer. Default is -1 (final layer)
+    pooling : str
+        How the tokens are pooled. Either 'mean', 'last' or 'max'. Default is 'mean'
+    batch_size : int
+        The number of texts per forward pass. Default is 8
+
+    Returns
+    -------
+    embeddings : numpy array
+        A numpy array of shape (n_texts, 768)
+    """
+    import torch
+
+    if pooling not in POOLINGS:
+        raise ValueError(f"pooling must be one of {POOLINGS}")
+
+    # GPT2 has no padding token. Padding is on the right and masked out, so its value does not matter
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "right"
+
+    tokenized_txts = [tokenizer.encode(text, truncation=True, max_length=model.config.n_positions) for text in texts]
+    # empty texts are represented by the end-of-text token
+    tokenized_txts = [txt if len(txt) > 0 else [tokenizer.eos_token_id] for txt in tokenized_txts]
+
+    # batch texts of similar length to keep the padding short
+    order = np.argsort([len(txt) for txt in tokenized_txts], kind="stable")
+    embeddings = np.empty((len(texts), model.config.hidden_size), dtype=np.float32)
+
+    with torch.no_grad():
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            batch = tokenizer.pad({"input_ids": [tokenized_txts[i] for i in idx]}, return_tensors="pt")
+
+            hidden_state = extract_layer(model, batch["input_ids"], batch["attention_mask"], layer=layer)
+            embeddings[idx] = pool(hidden_state, batch["attention_mask"], pooling=pooling).numpy()
+
+    return embeddings
+
+
+def _init_worker(tokenizer, model, n_threads, options):
+    """
+    Initialises a worker process with the shared model, its thread budget and the options passed on to embed_texts
+    """
+    import torch
+
+    global _worker_model, _worker_tokenizer, _worker_options
+
+    torch.set_num_threads(n_threads)
+    _worker_tokenizer = tokenizer
+    _worker_model = model
+    _worker_options = options
+
+
+def _embed_shard(shard):
+    """
+    Embeds a shard of texts in a worker process. The index of the shard is returned, so the embeddings can be reassembled in order
+    """
+    index, texts = shard
+
+    return index, embed_texts(texts, _worker_tokenizer, _worker_model, **_worker_options)
+
+
+class GPT2Pool:
+    def __init__(self, tokenizer, model, n_workers, n_threads = None, layer = -1, pooling = "mean", batch_size = 8):
+        """
+        Pool of worker processes sharing one GPT2 model. The model is moved to shared memory and sent to the workers once, so the pool can embed several lists of texts without reloading it. Use it as a context manager, or call close when done
+
+        Parameters
+        ----------
+        tokenizer : GPT2Tokenizer
+            The GPT2 tokenizer
+        model : GPT2Model
+            The GPT2 model
+        n_workers : int
+            The number of worker processes
+        n_threads : int
+            The number of torch threads per worker. Default is None (the cores divided evenly between the workers)
+        layer : int
+            The layer to extract. See extract_layer. Default is -1 (final layer)
+        pooling : str
+            How the tokens are pooled. Either 'mean', 'last' or 'max'. Default is 'mean'
+        batch_size : int
+            The number of texts per forward pass. Default is 8
+        """
+        import torch
+
+        if n_threads is None:
+            n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+
+        self.n_workers = n_workers
+        self.hidden_size = model.config.hidden_size
+        options = {"layer": layer, "pooling": pooling, "batch_size": batch_size}
+
+        # move the weights to shared memory, so the workers do not each get a copy
+        model.share_memory()
+
+        ctx = torch.multiprocessing.get_context("spawn")
+        self.pool = ctx.Pool(n_workers, initializer=_init_worker, initargs=(tokenizer, model, n_threads, options))
+
+    def embed(self, texts, shards_per_worker = 4):
+        """
+        Embeds a list of texts, split into shards that are distributed over the workers
+
+        Parameters
+        ----------
+        texts : list
+            A list of strings
+        shards_per_worker : int
+            The number of shards per worker. More shards balance the load better when the texts differ in length. Default is 4
+
+        Returns
+        -------
+        embeddings : numpy array
+            A numpy array of shape (n_texts, 768) in the order of the texts
+        """
+        texts = list(texts)
+
+        if len(texts) == 0:
+            return np.empty((0, self.hidden_size), dtype=np.float32)
+
+        n_shards = min(len(texts), self.n_workers * shards_per_worker)
+        bounds = np.linspace(0, len(texts), n_shards + 1).astype(int)
+        shards = [(i, texts[bounds[i]:bounds[i + 1]]) for i in range(n_shards)]
+
+        results = dict(self.pool.imap_unordered(_embed_shard, shards))
+
+        return np.concatenate([results[i] for i in range(n_shards)], axis=0)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def get_gpt2_embeddings(texts, n_workers = 1, n_threads = None, shards_per_worker = 4, layer = -1, pooling = "mean", batch_size = 8):
+    """
+    Gets the GPT2 embeddings of a list of texts, optionally sharded across several worker processes. The workers share the read-only model weights through shared memory and each uses a fixed number of threads, so several workers do not oversubscribe the cores
+
+    Parameters
+    ----------
+    texts : list
+        A list of strings
+    n_workers : int
+        The number of worker processes. Default is 1 (embed in the current process)
+    n_threads : int
+        The number of torch threads per worker. Default is None, which uses torch's default for a single worker and divides the cores evenly between several workers
+    shards_per_worker : int
+        The number of shards per worker. More shards balance the load better when the texts differ in length. Default is 4
+    layer : int
+        The layer to extract. See extract_layer. Default is -1 (final layer)
+    pooling : str
+        How the tokens are pooled. Either 'mean', 'last' or 'max'. Default is 'mean'
+    batch_size : int
+        The number of texts per forward pass. Default is 8
+
+    Returns
+    -------
+    embeddings : numpy array
+        A numpy array of shape (n_texts, 768) in the order of the texts
+    """
+    import torch
+
+    texts = list(texts)
+    tokenizer, model = load_gpt2()
+    options = {"layer": layer, "pooling": pooling, "batch_size": batch_size}
+
+    if n_workers <= 1:
+        # the thread count is global to the process, so it is restored for the caller
+        previous_threads = torch.get_num_threads()
+        if n_threads is not None:
+            torch.set_num_threads(n_threads)
+        try:
+            return embed_texts(texts, tokenizer, model, **options)
+        finally:
+            torch.set_num_threads(previous_threads)
+
+    if len(texts) == 0:
+        return np.empty((0, model.config.hidden_size), dtype=np.float32)
+
+    with GPT2Pool(tokenizer, model, n_workers, n_threads, **options) as pool:
+        return pool.embed(texts, shards_per_worker)
+
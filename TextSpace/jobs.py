@@ -0,0 +1,375 @@
+import os
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from multiprocessing import get_context
+from pathlib import Path
+
+import pandas as pd
+
+from data import TextSpaceData, check_col
+from store import EMBEDDING_TYPES, save_spaces
+
+REQUIRED_COLS = ["author", "text_full", "title"]
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def read_table(path:Path):
+    """
+    Reads an uploaded CSV or Parquet file
+
+    Raises
+    ------
+    ValueError
+        If the file is neither a CSV nor a Parquet file
+    """
+    path = Path(path)
+
+    if path.suffix == ".csv":
+        return pd.read_csv(path)
+    elif path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    else:
+        raise ValueError("Only .csv and .parquet files are supported")
+
+
+def read_header(path:Path):
+    """
+    Reads only the column names of an uploaded CSV or Parquet file, so an upload can be checked without parsing the whole file
+
+    Returns
+    -------
+    df : pandas DataFrame
+        An empty dataframe with the columns of the file
+
+    Raises
+    ------
+    ValueError
+        If the file is neither a CSV nor a Parquet file
+    """
+    path = Path(path)
+
+    if path.suffix == ".csv":
+        return pd.read_csv(path, nrows=0)
+    elif path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pd.DataFrame(columns=pq.read_schema(path).names)
+    else:
+        raise ValueError("Only .csv and .parquet files are supported")
+
+
+def validate_table(df):
+    """
+    Checks that an uploaded dataframe has the columns TextSpaceData needs, using the same rules as TextSpaceData
+
+    Raises
+    ------
+    ValueError
+        If a column is missing or contains NaN values
+    """
+    for col in REQUIRED_COLS:
+        check_col(df, col)
+
+
+def _connect(db_path):
+    return closing(sqlite3.connect(db_path, timeout=30))
+
+
+def _update(db_path, job_id, unless_cancelled = False, **values):
+    """
+    Updates the columns of a job. If unless_cancelled is True, a cancelled job is left unchanged
+
+    Returns
+    -------
+    updated : bool
+        Whether the job was updated
+    """
+    values["updated"] = time.time()
+    assignments = ", ".join(f"{key} = ?" for key in values)
+    condition = " AND status != 'cancelled'" if unless_cancelled else ""
+
+    with _connect(db_path) as conn, conn:
+        n_rows = conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?{condition}", (*values.values(), job_id)).rowcount
+
+    return n_rows > 0
+
+
+def _progress(db_path, job_id, **values):
+    """
+    Updates the columns of a job that has not been cancelled
+
+    Raises
+    ------
+    JobCancelled
+        If the job has been cancelled
+    """
+    if not _update(db_path, job_id, unless_cancelled=True, **values):
+        raise JobCancelled()
+
+
+def _pid_alive(pid):
+    """
+    Checks whether a process with the pid exists
+    """
+    if pid is None:
+        return False
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def _status(db_path, job_id):
+    with _connect(db_path) as conn:
+        return conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def _tmp_dir(out_dir:Path):
+    """
+    Returns the directory a space store is built in before it is moved to out_dir. It is hidden, so the dash app does not list the store before it is complete
+    """
+    return out_dir.with_name("." + out_dir.name + ".tmp")
+
+
+def _build_spaces(db_path, job_id, data_path, out_dir, embedding_types, n_clusters):
+    """
+    Builds the spaces of a job and saves them as a space store. The status updates are conditional on the job not being cancelled, so a cancelled job stops at its next update and never overwrites the cancellation
+    """
+    out_dir = Path(out_dir)
+    tmp_dir = _tmp_dir(out_dir)
+
+    try:
+        _progress(db_path, job_id, status="running", pid=os.getpid(), message="Reading file")
+
+        df = read_table(data_path)
+        validate_table(df)
+
+        TextSpace_dict = {}
+        for i, embedding_type in enumerate(embedding_types):
+            _progress(db_path, job_id, progress=i / len(embedding_types), message=f"Embedding ({embedding_type})")
+
+            TextSpace_dict[embedding_type] = TextSpaceData(df, embedding_type=embedding_type)
+            TextSpace_dict[embedding_type].get_clusters(n_clusters)
+
+        _progress(db_path, job_id, message="Saving")
+        save_spaces(TextSpace_dict, tmp_dir)
+
+        # the store is moved into place in the transaction marking the job as done, so a job cancelled while saving leaves no store behind
+        with _connect(db_path) as conn, conn:
+            n_rows = conn.execute(
+                "UPDATE jobs SET status = 'done', progress = 1.0, message = 'Done', updated = ? WHERE id = ? AND status != 'cancelled'",
+                (time.time(), job_id)
+                ).rowcount
+            if n_rows == 0:
+                raise JobCancelled()
+            tmp_dir.rename(out_dir)
+
+    except JobCancelled:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        _update(db_path, job_id, unless_cancelled=True, status="failed", message=str(e))
+
+
+def run_job(db_path, job_id, data_path, out_dir, embedding_types=EMBEDDING_TYPES, n_clusters=8, poll_interval=1.0):
+    """
+    Builds the spaces of an uploaded corpus and saves them as a space store. Runs in a worker process of the job queue, which builds the spaces in a child process and terminates it as soon as the job is cancelled, so cancelling does not wait for the embedding step that is running
+
+    Parameters
+    ----------
+    db_path : str or Path
+        Path to the job database
+    job_id : int
+        The id of the job
+    data_path : str or Path
+        Path to the uploaded file
+    out_dir : str or Path
+        Directory to save the space store in
+    embedding_types : list
+        The embedding types to compute
+    n_clusters : int
+        The number of clusters to precompute for each space
+    poll_interval : float
+        Seconds between checks for cancellation. Default is 1
+    """
+    out_dir = Path(out_dir)
+
+    process = get_context("spawn").Process(target=_build_spaces, args=(db_path, job_id, data_path, out_dir, embedding_types, n_clusters))
+    process.start()
+
+    while process.is_alive():
+        process.join(poll_interval)
+        if process.is_alive() and _status(db_path, job_id) == "cancelled":
+            process.terminate()
+            process.join()
+
+    if _status(db_path, job_id) == "cancelled":
+        shutil.rmtree(_tmp_dir(out_dir), ignore_errors=True)
+        _update(db_path, job_id, message="Cancelled")
+    elif process.exitcode != 0:
+        # the build process died without reporting, e.g. killed for running out of memory
+        _update(db_path, job_id, unless_cancelled=True, status="failed", message=f"Build process exited with code {process.exitcode}")
+
+
+class JobQueue:
+    def __init__(self, jobs_dir:Path, max_workers = 1, n_clusters = 8):
+        """
+        Queue of background jobs building the spaces of uploaded corpora. The jobs are kept in a SQLite database and run on a pool of worker processes, so the dash request threads never block on the embedding models
+
+        Parameters
+        ----------
+        jobs_dir : str or Path
+            Directory for the job database, the uploaded files (uploads/) and the finished space stores (spaces/)
+        max_workers : int
+            The number of worker processes. Default is 1
+        n_clusters : int
+            The number of clusters to precompute for each space. Default is 8
+        """
+        self.jobs_dir = Path(jobs_dir)
+        self.upload_dir = self.jobs_dir / "uploads"
+        self.store_dir = self.jobs_dir / "spaces"
+        self.db_path = self.jobs_dir / "jobs.sqlite"
+        self.n_clusters = n_clusters
+
+        for directory in [self.upload_dir, self.store_dir]:
+            directory.mkdir(parents=True, exist_ok=True)
+
+        with _connect(self.db_path) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT NOT NULL DEFAULT '',
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    pid INTEGER
+                )""")
+            if "pid" not in [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]:
+                conn.execute("ALTER TABLE jobs ADD COLUMN pid INTEGER")
+
+            # the pid is the process that queued the job until a worker starts it. Jobs whose process no longer
+            # exists cannot be resumed, while jobs of other live processes (e.g. other gunicorn workers) are left alone
+            active = conn.execute("SELECT id, pid FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+            stale = [(time.time(), job_id) for job_id, pid in active if not _pid_alive(pid)]
+            conn.executemany("UPDATE jobs SET status = 'failed', message = 'Interrupted', updated = ? WHERE id = ? AND status IN ('queued', 'running')", stale)
+
+        self.max_workers = max_workers
+        self.executor = None
+        self.executor_pid = None
+        self.futures = {}
+
+    def save_upload(self, filename, content):
+        """
+        Saves the content of an uploaded file in the upload directory and returns its path
+        """
+        path = self.upload_dir / f"{time.time_ns()}_{Path(filename).name}"
+        path.write_bytes(content)
+
+        return path
+
+    def submit(self, name, data_path:Path, reserved_names=()):
+        """
+        Adds a job building the spaces of an uploaded file
+
+        Parameters
+        ----------
+        name : str
+            The name of the corpus. A suffix is added if a corpus with the same name exists
+        data_path : str or Path
+            Path to the uploaded file
+        reserved_names : iterable
+            Names of corpora served from elsewhere, which also get a suffix. Default is none
+
+        Returns
+        -------
+        job_id : int
+            The id of the job
+        """
+        with _connect(self.db_path) as conn, conn:
+            now = time.time()
+            job_id = conn.execute(
+                "INSERT INTO jobs (name, path, status, created, updated, pid) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (name, str(data_path), now, now, os.getpid())
+                ).lastrowid
+            n_same_name = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE name = ? AND id != ? AND status IN ('queued', 'running', 'done')",
+                (name, job_id)
+                ).fetchone()[0]
+
+        out_dir = self.store_dir / name
+        if out_dir.exists() or n_same_name > 0 or name in reserved_names:
+            name = f"{name}-{job_id}"
+            out_dir = self.store_dir / name
+            _update(self.db_path, job_id, name=name)
+
+        # created on the first job of each process, so a pool inherited by forked server workers is never used.
+        # spawn, so the workers do not inherit the threads of the web server
+        if self.executor is None or self.executor_pid != os.getpid():
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context("spawn"))
+            self.executor_pid = os.getpid()
+
+        self.futures[job_id] = self.executor.submit(run_job, self.db_path, job_id, data_path, out_dir, n_clusters=self.n_clusters)
+
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued or running job. A running job is terminated by its worker within poll_interval of run_job
+        """
+        with _connect(self.db_path) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+                )
+
+        # jobs that have not started yet are removed from the pool directly
+        if job_id in self.futures and self.futures[job_id].cancel():
+            _update(self.db_path, job_id, message="Cancelled")
+
+    def active_names(self):
+        """
+        Returns the names of the queued and running jobs
+        """
+        with _connect(self.db_path) as conn:
+            rows = conn.execute("SELECT name FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+
+        return {name for name, in rows}
+
+    def get(self, job_id):
+        """
+        Returns a job as a dictionary
+        """
+        with _connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        return None if row is None else dict(row)
+
+    def list_jobs(self, limit = 20):
+        """
+        Returns the most recent jobs as a list of dictionaries
+        """
+        with _connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,31 @@
 import plotly.express as px
 from data import TextSpaceData
 
-def plot_embeddings_3d(data:TextSpaceData):
+def plot_embeddings_3d(data:TextSpaceData, color_by="author", n_clusters=8):
+    """
+    Plots the documents in 3D
+
+    Parameters
+    ----------
+    data : TextSpaceData
+        The data to plot
+    color_by : str
+        Either 'author' or 'cluster'. Default is 'author'
+    n_clusters : int
+        The number of clusters used when colouring by cluster. Default is 8
+    """
+    if color_by == "author":
+        plot_data = data.get_plot_data()
+        color = data.author_col
+    elif color_by == "cluster":
+        plot_data = data.get_plot_data(n_clusters=n_clusters)
+        color = "cluster"
+    else:
+        raise ValueError("color_by must be either 'author' or 'cluster'")
+
     # plotly
-    fig = px.scatter_3d(data.get_plot_data(), x='x', y='y', z='z', 
-                        color='author', hover_name=data.author_col, 
+    fig = px.scatter_3d(plot_data, x='x', y='y', z='z', 
+                        color=color, hover_name=data.author_col, 
                         text=data.title_col,
                         size_max=10, opacity=0.7)
 
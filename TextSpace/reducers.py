@@ -0,0 +1,203 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+
+def fit_pca(embeddings, n_components=3, random_state=0, svd_solver="full"):
+    """
+    Fits PCA on the embeddings. As in the original TextSpace setup the documents are the features, so the coordinates are the principal axes
+
+    Parameters
+    ----------
+    embeddings : numpy array
+        A numpy array of shape (n_features, n_documents)
+    n_components : int
+        The number of components to keep
+    random_state : int
+        Seed used by the randomized and arpack solvers
+    svd_solver : str
+        The solver to use. Either 'full', 'randomized' or 'arpack'
+
+    Returns
+    -------
+    reducer : PCA object
+        The fitted PCA object
+    coords : numpy array
+        A numpy array of shape (n_documents, n_components)
+    """
+    from sklearn.decomposition import PCA
+
+    reducer = PCA(n_components=n_components, svd_solver=svd_solver, random_state=random_state)
+    reducer.fit(embeddings)
+
+    return reducer, reducer.components_.transpose()
+
+
+def fit_pca_randomized(embeddings, n_components=3, random_state=0):
+    """
+    Fits PCA using the randomized solver, which is considerably faster for large corpora
+    """
+    return fit_pca(embeddings, n_components, random_state, svd_solver="randomized")
+
+
+def fit_pca_arpack(embeddings, n_components=3, random_state=0):
+    """
+    Fits PCA using the arpack solver, which only computes the requested components
+    """
+    return fit_pca(embeddings, n_components, random_state, svd_solver="arpack")
+
+
+def fit_svd(embeddings, n_components=3, random_state=0):
+    """
+    Fits truncated SVD on the embeddings. Unlike PCA the data is not centered, which is useful for sparse count embeddings such as bag-of-words
+
+    Parameters
+    ----------
+    embeddings : numpy array
+        A numpy array of shape (n_features, n_documents)
+    n_components : int
+        The number of components to keep
+    random_state : int
+        Seed for the randomized solver
+
+    Returns
+    -------
+    reducer : TruncatedSVD object
+        The fitted TruncatedSVD object
+    coords : numpy array
+        A numpy array of shape (n_documents, n_components)
+    """
+    from sklearn.decomposition import TruncatedSVD
+
+    reducer = TruncatedSVD(n_components=n_components, algorithm="randomized", random_state=random_state)
+    reducer.fit(embeddings)
+
+    return reducer, reducer.components_.transpose()
+
+
+def fit_tsne(embeddings, n_components=3, random_state=0):
+    """
+    Fits a Barnes-Hut t-SNE on the documents. t-SNE cannot project new documents, so only the coordinates are meaningful
+
+    Parameters
+    ----------
+    embeddings : numpy array
+        A numpy array of shape (n_features, n_documents)
+    n_components : int
+        The number of components to keep. Barnes-Hut t-SNE supports at most 3
+    random_state : int
+        Seed for the initialisation
+
+    Returns
+    -------
+    reducer : TSNE object
+        The fitted TSNE object
+    coords : numpy array
+        A numpy array of shape (n_documents, n_components)
+    """
+    from sklearn.manifold import TSNE
+
+    documents = np.asarray(embeddings, dtype=np.float32).transpose()
+
+    # perplexity has to be smaller than the number of documents
+    perplexity = min(30.0, max(1.0, (documents.shape[0] - 1) / 3))
+
+    reducer = TSNE(n_components=n_components, method="barnes_hut", perplexity=perplexity, init="pca", random_state=random_state)
+    coords = reducer.fit_transform(documents)
+
+    return reducer, coords
+
+
+REDUCERS = {
+    "pca": fit_pca,
+    "pca_randomized": fit_pca_randomized,
+    "pca_arpack": fit_pca_arpack,
+    "svd": fit_svd,
+    "tsne": fit_tsne,
+}
+
+
+def embedding_hash(embeddings):
+    """
+    Returns a hash of the embeddings which is used as key for the reducer cache. The rows are hashed one at a time, so the embeddings are not copied as a whole
+    """
+    embeddings = np.asarray(embeddings)
+
+    sha = hashlib.sha1()
+    sha.update(str(embeddings.shape).encode())
+    sha.update(str(embeddings.dtype).encode())
+    for row in np.atleast_2d(embeddings):
+        sha.update(np.ascontiguousarray(row).tobytes())
+
+    return sha.hexdigest()
+
+
+def dump_atomic(obj, path:Path):
+    """
+    Saves an object with joblib by writing to a temporary file in the same directory and moving it into place, so concurrent builds never load a partially written file
+    """
+    import joblib
+
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix="." + path.name, suffix=".tmp")
+    os.close(fd)
+
+    try:
+        joblib.dump(obj, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def reduce_embeddings(embeddings, method="pca", n_components=3, random_state=0, cache_dir=None):
+    """
+    Reduces the embeddings to n_components dimensions using one of the reducers in REDUCERS. If cache_dir is given, the fitted reducer is persisted and reused when the same embeddings are reduced again
+
+    Parameters
+    ----------
+    embeddings : numpy array
+        A numpy array of shape (n_features, n_documents)
+    method : str
+        The reducer to use. One of the keys in REDUCERS. Default is 'pca'
+    n_components : int
+        The number of components to keep
+    random_state : int
+        Seed passed to the reducer
+    cache_dir : str or Path
+        Directory to persist fitted reducers in. Default is None (no caching)
+
+    Returns
+    -------
+    reducer : object
+        The fitted reducer
+    coords : numpy array
+        A numpy array of shape (n_documents, n_components)
+
+    Raises
+    ------
+    ValueError
+        If the method is not one of the keys in REDUCERS
+    """
+    if method not in REDUCERS:
+        raise ValueError(f"method must be one of {list(REDUCERS.keys())}")
+
+    if cache_dir is None:
+        return REDUCERS[method](embeddings, n_components=n_components, random_state=random_state)
+
+    import joblib
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = cache_dir / f"{embedding_hash(embeddings)}_{method}_{n_components}_{random_state}.joblib"
+
+    if cache_file.exists():
+        reducer, coords = joblib.load(cache_file)
+    else:
+        reducer, coords = REDUCERS[method](embeddings, n_components=n_components, random_state=random_state)
+        dump_atomic((reducer, coords), cache_file)
+
+    return reducer, coords
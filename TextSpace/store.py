@@ -0,0 +1,142 @@
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from data import TextSpaceData
+
+EMBEDDING_TYPES = ["emotion", "gpt2", "bow", "topic"]
+
+
+def is_space_store(path:Path):
+    """
+    Checks whether a path is a directory written by save_spaces
+    """
+    return (Path(path) / "meta.json").exists()
+
+
+def save_spaces(TextSpace_dict, out_dir:Path):
+    """
+    Saves precomputed TextSpaceData objects of one corpus to a directory. The embeddings and coordinates are saved as .npy files so they can be memory-mapped by load_spaces. Clusterings already computed with get_clusters are saved as well. The store is built in a hidden directory next to out_dir and renamed into place, so an existing store that is being served is replaced, never overwritten
+
+    Parameters
+    ----------
+    TextSpace_dict : dict
+        Dictionary of TextSpaceData objects with the embedding type as key. All objects must share the same dataframe
+    out_dir : str or Path
+        Directory to save the spaces in
+    """
+    out_dir = Path(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+
+    # hidden, so the dash app does not list the store before it is complete
+    tmp_dir = Path(tempfile.mkdtemp(dir=out_dir.parent, prefix=f".{out_dir.name}.", suffix=".tmp"))
+
+    try:
+        first = next(iter(TextSpace_dict.values()))
+        first.df.to_csv(tmp_dir / "data.csv", index=False)
+
+        for embedding_type, space in TextSpace_dict.items():
+            np.save(tmp_dir / f"{embedding_type}_embeddings.npy", np.asarray(space.embeddings, dtype=np.float32))
+            np.save(tmp_dir / f"{embedding_type}_coords.npy", np.asarray(space.coords, dtype=np.float32))
+
+            if len(space.clusters) > 0:
+                joblib.dump(space.clusters, tmp_dir / f"{embedding_type}_clusters.joblib")
+
+        meta = {
+            "author_col": first.author_col,
+            "text_col": first.text_col,
+            "title_col": first.title_col,
+            "embedding_types": list(TextSpace_dict.keys()),
+        }
+        with open(tmp_dir / "meta.json", "w") as f:
+            json.dump(meta, f)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # the old store is moved aside and deleted rather than overwritten. Its files are unlinked, not truncated,
+    # so processes that still have its arrays memory-mapped keep reading the old data
+    old_dir = None
+    if out_dir.exists():
+        old_dir = out_dir.with_name(f".{out_dir.name}.{time.time_ns()}.old")
+        out_dir.rename(old_dir)
+
+    tmp_dir.rename(out_dir)
+
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def preload_spaces(data_path:Path, out_dir:Path, embedding_types=EMBEDDING_TYPES, n_clusters=8, **kwargs):
+    """
+    Computes the spaces of a corpus once and saves them with save_spaces
+
+    Parameters
+    ----------
+    data_path : str or Path
+        Path to the data file
+    out_dir : str or Path
+        Directory to save the spaces in
+    embedding_types : list
+        The embedding types to compute
+    n_clusters : int
+        The number of clusters to precompute for each space. Default is 8
+    **kwargs
+        Passed on to TextSpaceData, e.g. reducer or cache_dir
+    """
+    df = pd.read_csv(data_path)
+
+    TextSpace_dict = {}
+    for embedding_type in embedding_types:
+        TextSpace_dict[embedding_type] = TextSpaceData(df, embedding_type=embedding_type, **kwargs)
+        TextSpace_dict[embedding_type].get_clusters(n_clusters)
+
+    save_spaces(TextSpace_dict, out_dir)
+
+
+def load_spaces(store_dir:Path, mmap_mode="r"):
+    """
+    Loads the spaces saved with save_spaces without recomputing them. The arrays are memory-mapped read-only, so several processes serving the same store share a single copy through the page cache
+
+    Parameters
+    ----------
+    store_dir : str or Path
+        Directory the spaces were saved in
+    mmap_mode : str
+        Passed on to numpy.load. Default is 'r'
+
+    Returns
+    -------
+    TextSpace_dict : dict
+        Dictionary of TextSpaceData objects with the embedding type as key
+    """
+    store_dir = Path(store_dir)
+
+    with open(store_dir / "meta.json") as f:
+        meta = json.load(f)
+
+    df = pd.read_csv(store_dir / "data.csv")
+
+    TextSpace_dict = {}
+    for embedding_type in meta["embedding_types"]:
+        TextSpace_dict[embedding_type] = TextSpaceData(
+            df,
+            author_col=meta["author_col"],
+            text_col=meta["text_col"],
+            title_col=meta["title_col"],
+            embedding_type=embedding_type,
+            embeddings=np.load(store_dir / f"{embedding_type}_embeddings.npy", mmap_mode=mmap_mode),
+            coords=np.load(store_dir / f"{embedding_type}_coords.npy", mmap_mode=mmap_mode)
+            )
+
+        clusters_file = store_dir / f"{embedding_type}_clusters.joblib"
+        if clusters_file.exists():
+            TextSpace_dict[embedding_type].clusters = joblib.load(clusters_file)
+
+    return TextSpace_dict
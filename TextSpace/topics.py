@@ -0,0 +1,169 @@
+import itertools
+import random
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+
+def iter_chunks(texts, chunk_size):
+    """
+    Yields consecutive chunks of chunk_size texts. The texts can be any iterable and are not copied as a whole
+    """
+    texts = iter(texts)
+    while True:
+        chunk = list(itertools.islice(texts, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def sample_texts(texts, n, random_state = 0):
+    """
+    Draws a uniform sample of at most n texts in a single pass (reservoir sampling), so only the sample is kept in memory. If there are at most n texts, all of them are returned in their original order
+    """
+    rng = random.Random(random_state)
+    sample = []
+
+    for i, text in enumerate(texts):
+        if i < n:
+            sample.append(text)
+        else:
+            j = rng.randint(0, i)
+            if j < n:
+                sample[j] = text
+
+    return sample
+
+
+class TopicEngine:
+    def __init__(self, n_topics = 12, chunk_size = 1000, n_epochs = 10, learning_offset = 1.0, n_jobs = None, max_features = 10000, max_fit_docs = 50000, random_state = 0):
+        """
+        Topic model used for the topic space. The model is fitted on a sample of at most max_fit_docs documents: the vocabulary is counted chunk by chunk, the sample is vectorized once into sparse chunks and the LDA is fitted with online mini-batch learning (partial_fit) over these chunks, so the fit time and memory do not grow with the corpus. All documents are then projected chunk by chunk. The fitted vectorizer and LDA can be saved, so new documents can be projected without refitting
+
+        Parameters
+        ----------
+        n_topics : int
+            The number of topics. Default is 12
+        chunk_size : int
+            The number of documents per mini-batch. Default is 1000
+        n_epochs : int
+            The number of passes over the chunks. Like max_iter of the batch LDA, each pass updates the topics once per chunk, so small corpora need several passes. Default is 10
+        learning_offset : float
+            Down-weights the first mini-batch updates. The low default lets the topics move away from their random initialisation within a few updates, which matters for small corpora with only one chunk per pass. Default is 1.0
+        n_jobs : int
+            The number of jobs used in the E-step of the LDA. Default is None (1 job), -1 uses all cores
+        max_features : int
+            The maximum size of the vocabulary, which bounds the size of the topic-word matrix. Default is 10000
+        max_fit_docs : int
+            The maximum number of documents used to fit the model. Online LDA converges after a bounded number of documents, so fitting on a subsample keeps the fit time and memory constant for large corpora. All documents are still transformed. None fits on all documents, in which case the sparse document-term matrix of the whole corpus is kept during the fit. Default is 50000
+        random_state : int
+            Seed for the LDA and the subsample. Default is 0
+        """
+        self.n_topics = n_topics
+        self.chunk_size = chunk_size
+        self.n_epochs = n_epochs
+        self.learning_offset = learning_offset
+        self.n_jobs = n_jobs
+        self.max_features = max_features
+        self.max_fit_docs = max_fit_docs
+        self.random_state = random_state
+
+        self.vectorizer = None
+        self.lda = None
+
+    def fit(self, texts):
+        """
+        Fits the vectorizer and the LDA on the texts
+
+        Parameters
+        ----------
+        texts : iterable
+            An iterable of strings, which is read once if max_fit_docs is set
+
+        Returns
+        -------
+        self : TopicEngine
+            The fitted topic engine
+        """
+        from sklearn.feature_extraction.text import CountVectorizer
+        from sklearn.decomposition import LatentDirichletAllocation
+
+        if self.max_fit_docs is not None:
+            texts = sample_texts(texts, self.max_fit_docs, random_state=self.random_state)
+        else:
+            texts = list(texts)
+
+        # count the terms text by text instead of building the document-term matrix as CountVectorizer.fit does,
+        # and keep the max_features most frequent terms like CountVectorizer
+        analyzer = CountVectorizer().build_analyzer()
+        term_counts = Counter()
+        for text in texts:
+            term_counts.update(analyzer(text))
+
+        terms = sorted(term_counts, key=lambda term: (-term_counts[term], term))[:self.max_features]
+        self.vectorizer = CountVectorizer(vocabulary={term: i for i, term in enumerate(sorted(terms))})
+
+        self.lda = LatentDirichletAllocation(
+            n_components=self.n_topics,
+            learning_method="online",
+            batch_size=self.chunk_size,
+            learning_offset=self.learning_offset,
+            total_samples=len(texts),
+            n_jobs=self.n_jobs,
+            random_state=self.random_state
+            )
+
+        # the sample is tokenized once, every epoch reuses the sparse chunks
+        chunks = [self.vectorizer.transform(chunk) for chunk in iter_chunks(texts, self.chunk_size)]
+
+        for _ in range(self.n_epochs):
+            for chunk in chunks:
+                self.lda.partial_fit(chunk)
+
+        return self
+
+    def transform(self, texts):
+        """
+        Projects texts onto the topics of the fitted model, one chunk at a time
+
+        Parameters
+        ----------
+        texts : iterable
+            An iterable of strings
+
+        Returns
+        -------
+        embeddings : numpy array
+            A numpy array of shape (n_documents, n_topics) with the topic distribution of each text
+        """
+        if self.lda is None:
+            raise ValueError("TopicEngine has not been fitted")
+
+        embeddings = [self.lda.transform(self.vectorizer.transform(chunk)) for chunk in iter_chunks(texts, self.chunk_size)]
+
+        return np.vstack(embeddings)
+
+    def fit_transform(self, texts):
+        """
+        Fits the model on the texts and projects them onto the topics
+        """
+        return self.fit(texts).transform(texts)
+
+    def save(self, path:Path):
+        """
+        Saves the fitted vectorizer and LDA
+        """
+        import joblib
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path:Path):
+        """
+        Loads a topic engine saved with save
+        """
+        import joblib
+
+        return joblib.load(path)
@@ -0,0 +1,89 @@
+"""
+Benchmarks the throughput of the sharded GPT2 inference for different numbers of worker processes and threads per worker, to find the best setting for a given machine. The model is loaded once. For each setting the setup time (starting the worker pool and a warm-up pass) is reported separately from the inference time, so the throughput does not include loading the model or starting the workers.
+
+Usage: python examples/src/benchmark_gpt2.py --workers 1 2 4 --threads 1 2 4 8
+"""
+
+from pathlib import Path
+import argparse
+import os
+import time
+
+import pandas as pd
+import torch
+
+import sys
+sys.path.append(str(Path(__file__).parents[2] / "TextSpace"))
+from gpt2 import GPT2Pool, embed_texts, load_gpt2
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv_file", type = str, default = "plotly_data.csv")
+    parser.add_argument("--n_docs", type = int, default = 200, help = "the texts of the corpus are repeated up to this number")
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4])
+    parser.add_argument("--threads", type = int, nargs = "+", default = [1, 2, 4, 8])
+    parser.add_argument("--layer", type = int, default = -1)
+    parser.add_argument("--pooling", type = str, default = "mean")
+    parser.add_argument("--out_file", type = str, default = None)
+
+    return parser.parse_args()
+
+
+def main():
+    path = Path(__file__)
+    args = parse_args()
+
+    texts = pd.read_csv(path.parents[2] / "data" / args.csv_file)["text_full"].tolist()
+    texts = (texts * (args.n_docs // len(texts) + 1))[:args.n_docs]
+
+    n_cores = os.cpu_count()
+    options = {"layer": args.layer, "pooling": args.pooling}
+
+    start = time.perf_counter()
+    tokenizer, model = load_gpt2()
+    print(f"[INFO]: Loaded GPT2 in {time.perf_counter() - start:.1f} s")
+    print(f"[INFO]: Embedding {len(texts)} texts on {n_cores} cores")
+
+    results = []
+    for n_workers in args.workers:
+        for n_threads in args.threads:
+            if n_workers * n_threads > n_cores:
+                print(f"[INFO]: Skipping {n_workers} worker(s) x {n_threads} thread(s), which oversubscribes the cores")
+                continue
+
+            # setup covers starting the workers and a warm-up pass, which waits for them to load the model and pays for one-off allocations
+            start = time.perf_counter()
+            if n_workers == 1:
+                torch.set_num_threads(n_threads)
+                embed = lambda texts: embed_texts(texts, tokenizer, model, **options)
+            else:
+                pool = GPT2Pool(tokenizer, model, n_workers, n_threads, **options)
+                embed = pool.embed
+
+            try:
+                embed(texts)
+                setup_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                embed(texts)
+                seconds = time.perf_counter() - start
+            finally:
+                if n_workers > 1:
+                    pool.close()
+
+            print(f"[INFO]: {n_workers} worker(s) x {n_threads} thread(s): {len(texts) / seconds:.2f} texts/s (setup {setup_seconds:.1f} s)")
+            results.append({"workers": n_workers, "threads": n_threads, "setup_seconds": setup_seconds, "seconds": seconds, "texts_per_second": len(texts) / seconds})
+
+    results = pd.DataFrame(results)
+    print(results.pivot_table(index = "workers", columns = "threads", values = "texts_per_second").round(2))
+
+    best = results.loc[results["texts_per_second"].idxmax()]
+    print(f"[INFO]: Highest throughput with {int(best['workers'])} worker(s) x {int(best['threads'])} thread(s)")
+
+    if args.out_file is not None:
+        results.to_csv(args.out_file, index = False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmarks the fit time of the dimensionality reduction backends in TextSpace/reducers.py against corpus size and embedding dimensionality. Random embeddings are used, so no models have to be downloaded.
+
+Usage: python examples/src/benchmark_reducers.py --n_docs 100 1000 10000 --n_features 7 768 5000
+"""
+
+from pathlib import Path
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import sys
+sys.path.append(str(Path(__file__).parents[2] / "TextSpace"))
+from reducers import REDUCERS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_docs", type = int, nargs = "+", default = [100, 1000, 5000])
+    parser.add_argument("--n_features", type = int, nargs = "+", default = [7, 768, 5000])
+    parser.add_argument("--reducers", type = str, nargs = "+", default = list(REDUCERS.keys()))
+    parser.add_argument("--repeats", type = int, default = 3)
+    parser.add_argument("--out_file", type = str, default = None)
+
+    return parser.parse_args()
+
+
+def time_reducer(method, embeddings, repeats):
+    """
+    Returns the fastest fit time in seconds over a number of repeats
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        REDUCERS[method](embeddings, n_components = 3, random_state = 0)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(0)
+
+    results = []
+    for n_docs in args.n_docs:
+        for n_features in args.n_features:
+            # same orientation as TextSpaceData embeddings (n_features, n_documents)
+            embeddings = rng.standard_normal((n_features, n_docs))
+
+            for method in args.reducers:
+                try:
+                    fit_time = time_reducer(method, embeddings, args.repeats)
+                except ValueError as e:
+                    # e.g. arpack requires n_components < min(embeddings.shape)
+                    print(f"[INFO]: Skipping {method} for {n_docs} documents x {n_features} features: {e}")
+                    continue
+
+                print(f"[INFO]: {method:<15} {n_docs:>7} documents x {n_features:>5} features: {fit_time:.3f} s")
+                results.append({"reducer": method, "n_docs": n_docs, "n_features": n_features, "fit_time": fit_time})
+
+    results = pd.DataFrame(results)
+    print(results.pivot_table(index = ["n_docs", "n_features"], columns = "reducer", values = "fit_time").round(3))
+
+    if args.out_file is not None:
+        results.to_csv(args.out_file, index = False)
+
+
+if __name__ == "__main__":
+    main()
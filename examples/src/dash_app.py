@@ -11,9 +11,11 @@ from dash_application import get_dash_app
 
 if __name__ == '__main__':
     path = Path(__file__)
-    data_path = path.parents[2] / 'data' / 'plotly_data.csv'
+    # every csv file in the data folder is served as a separate corpus
+    data_path = path.parents[2] / 'data'
     print("Running Dash app...")
-    app = get_dash_app(data_path=data_path)
+    # uploaded corpora are embedded in the background and kept in data/jobs
+    app = get_dash_app(data_path=data_path, jobs_dir=path.parents[2] / 'data' / 'jobs')
     print("Go to the link provided in the terminal when the app is done opening.")
     print("Press CTRL+C to stop the app.")
     app.run_server(debug=False)
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Load test of the dash app served by gunicorn with an increasing number of workers. For each worker count a server is started, a number of concurrent clients request figures for random corpora, embedding types and colourings, and the request throughput is reported. The run is aborted if any request fails.
+
+Usage: python examples/src/load_test.py --workers 1 2 4 8 --clients 16 --duration 20
+"""
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import random
+import subprocess
+import time
+
+import pandas as pd
+import requests
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4, 8])
+    parser.add_argument("--clients", type = int, default = 16)
+    parser.add_argument("--duration", type = float, default = 20)
+    parser.add_argument("--port", type = int, default = 8050)
+    parser.add_argument("--out_file", type = str, default = None)
+
+    return parser.parse_args()
+
+
+def start_server(n_workers, port):
+    """
+    Starts gunicorn with the given number of workers and returns the process once the app responds
+    """
+    src_dir = Path(__file__).parent
+    process = subprocess.Popen(
+        ["gunicorn", "--preload", "--workers", str(n_workers), "--bind", f"127.0.0.1:{port}", "--chdir", str(src_dir), "wsgi:server"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    url = f"http://127.0.0.1:{port}/metrics"
+    start = time.perf_counter()
+    while True:
+        try:
+            requests.get(url, timeout=1).raise_for_status()
+            break
+        except requests.exceptions.RequestException:
+            if process.poll() is not None:
+                raise RuntimeError("gunicorn exited before the app was ready")
+            time.sleep(0.1)
+
+    print(f"[INFO]: {n_workers} worker(s) ready after {time.perf_counter() - start:.1f} s")
+
+    return process
+
+
+def figure_payload(corpus, embedding_type, color_by):
+    """
+    Returns the request body dash sends when the corpus, embedding type or colouring changes
+    """
+    return {
+        "output": "3d-plot.figure",
+        "outputs": {"id": "3d-plot", "property": "figure"},
+        "inputs": [
+            {"id": "corpus", "property": "value", "value": corpus},
+            {"id": "embedding-type", "property": "value", "value": embedding_type},
+            {"id": "color-by", "property": "value", "value": color_by},
+        ],
+        "changedPropIds": ["embedding-type.value"],
+    }
+
+
+def embedding_types_payload(corpus):
+    """
+    Returns the request body dash sends when the corpus dropdown changes, which is answered with the embedding types of the corpus
+    """
+    return {
+        "output": "..embedding-type.options...embedding-type.value..",
+        "outputs": [{"id": "embedding-type", "property": "options"}, {"id": "embedding-type", "property": "value"}],
+        "inputs": [{"id": "corpus", "property": "value", "value": corpus}],
+        "state": [{"id": "embedding-type", "property": "value", "value": None}],
+        "changedPropIds": ["corpus.value"],
+    }
+
+
+def get_embedding_types(url, corpus):
+    """
+    Returns the embedding types of a corpus, as a store can hold only some of them
+    """
+    response = requests.post(url, json=embedding_types_payload(corpus))
+    response.raise_for_status()
+
+    return [option["value"] for option in response.json()["response"]["embedding-type"]["options"]]
+
+
+def client(url, embedding_types, stop_time):
+    """
+    Sends figure requests for random corpora and their embedding types (a dictionary mapping each corpus to its types) until stop_time and returns the number of successful and failed requests together with the first error
+    """
+    session = requests.Session()
+    n_requests = 0
+    n_errors = 0
+    first_error = None
+
+    while time.perf_counter() < stop_time:
+        corpus = random.choice(list(embedding_types.keys()))
+        payload = figure_payload(corpus, random.choice(embedding_types[corpus]), random.choice(["author", "cluster"]))
+        try:
+            response = session.post(url, json=payload)
+            response.raise_for_status()
+            n_requests += 1
+        except requests.exceptions.RequestException as e:
+            n_errors += 1
+            if first_error is None:
+                first_error = str(e)
+
+    return n_requests, n_errors, first_error
+
+
+def main():
+    args = parse_args()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    results = []
+    for n_workers in args.workers:
+        process = start_server(n_workers, args.port)
+        try:
+            url = f"{base_url}/_dash-update-component"
+            corpora = requests.get(f"{base_url}/metrics").json()["loaded"]
+            embedding_types = {corpus: get_embedding_types(url, corpus) for corpus in corpora}
+
+            stop_time = time.perf_counter() + args.duration
+            with ThreadPoolExecutor(max_workers=args.clients) as executor:
+                futures = [executor.submit(client, url, embedding_types, stop_time) for _ in range(args.clients)]
+                client_results = [future.result() for future in futures]
+        finally:
+            process.terminate()
+            process.wait()
+
+        n_requests = sum(n for n, _, _ in client_results)
+        n_errors = sum(n for _, n, _ in client_results)
+
+        # a broken app would otherwise only show up as a low throughput
+        if n_errors > 0:
+            first_error = next(error for _, _, error in client_results if error is not None)
+            raise RuntimeError(f"{n_errors} of {n_requests + n_errors} requests failed with {n_workers} worker(s), e.g. {first_error}")
+
+        throughput = n_requests / args.duration
+        print(f"[INFO]: {n_workers} worker(s): {throughput:.1f} requests/s")
+        results.append({"workers": n_workers, "clients": args.clients, "requests": n_requests, "requests_per_second": throughput})
+
+    results = pd.DataFrame(results)
+    print(results)
+
+    if args.out_file is not None:
+        results.to_csv(args.out_file, index = False)
+
+
+if __name__ == "__main__":
+    main()
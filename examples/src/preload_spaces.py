@@ -0,0 +1,40 @@
+"""
+Precomputes the embedding spaces of a corpus once and saves them as a space store, which the dash app can memory-map instead of recomputing the embeddings in every worker.
+
+Usage: python examples/src/preload_spaces.py --csv_file plotly_data.csv
+"""
+
+from pathlib import Path
+import argparse
+
+import sys
+sys.path.append(str(Path(__file__).parents[2] / "TextSpace"))
+from store import EMBEDDING_TYPES, preload_spaces
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv_file", type = str, default="plotly_data.csv")
+    parser.add_argument("--out_dir", type = str, default="data/spaces")
+    parser.add_argument("--embedding_types", type = str, nargs = "+", default=EMBEDDING_TYPES)
+    parser.add_argument("--reducer", type = str, default="pca")
+    parser.add_argument("--cache_dir", type = str, default=None)
+    parser.add_argument("--n_clusters", type = int, default=8)
+
+    return parser.parse_args()
+
+
+def main():
+    path = Path(__file__)
+    args = parse_args()
+
+    csv_path = path.parents[2] / "data" / args.csv_file
+    out_dir = path.parents[2] / args.out_dir / csv_path.stem
+
+    print(f"[INFO]: Precomputing {', '.join(args.embedding_types)} spaces for {csv_path.name}...")
+    preload_spaces(csv_path, out_dir, embedding_types=args.embedding_types, n_clusters=args.n_clusters, reducer=args.reducer, cache_dir=args.cache_dir)
+    print(f"[INFO]: Saved spaces to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,23 @@ import sys
 sys.path.append(str(Path(__file__).parents[2] / "TextSpace")) 
 from plot3D import plot_embeddings_3d
 from data import TextSpaceData
+from topics import TopicEngine
+from export import write_html_bundle
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--csv_file", type = str, default="plotly_data.csv")
     parser.add_argument("--embedding_type", type = str, default="emotion")
+    parser.add_argument("--reducer", type = str, default="pca")
+    parser.add_argument("--cache_dir", type = str, default=None)
+    parser.add_argument("--n_topics", type = int, default=12)
+    parser.add_argument("--n_jobs", type = int, default=None)
+    parser.add_argument("--deduplicate", action = "store_true")
+    parser.add_argument("--gpt2_workers", type = int, default=1)
+    parser.add_argument("--gpt2_threads", type = int, default=None)
+    parser.add_argument("--gpt2_layer", type = int, default=-1)
+    parser.add_argument("--gpt2_pooling", type = str, default="mean")
+    parser.add_argument("--single_file", action = "store_true", help = "write all spaces to one compact plotly_spaces.html")
 
     return parser.parse_args()
 
@@ -27,14 +39,30 @@ def main():
 
     # load data
     data = pd.read_csv(path.parents[2] / "data" / args.csv_file)
+    TextSpace_dict = {}
     for embedding_type in ["topic", "bow", "emotion", "gpt2"]:
         # create TextSpaceData object
-        TextSpace = TextSpaceData(data, embedding_type=embedding_type)
+        TextSpace = TextSpaceData(data, embedding_type=embedding_type, reducer=args.reducer, cache_dir=args.cache_dir,
+                                  topic_engine=TopicEngine(n_topics=args.n_topics, n_jobs=args.n_jobs),
+                                  deduplicate=args.deduplicate, gpt2_workers=args.gpt2_workers, gpt2_threads=args.gpt2_threads,
+                                  gpt2_layer=args.gpt2_layer, gpt2_pooling=args.gpt2_pooling)
+
+        if args.deduplicate:
+            report = TextSpace.dedup_report
+            print(f"[INFO]: {report['n_duplicates']} of {report['n_documents']} texts are near-duplicates, saving {report['inference_saved']:.0%} of the {embedding_type} inference")
+
+        TextSpace_dict[embedding_type] = TextSpace
+
+        if args.single_file:
+            continue
 
         # plot embeddings in 3D
         fig = plot_embeddings_3d(TextSpace)
 
         fig.write_html(savepath / f"plotly_{embedding_type}.html")
 
+    if args.single_file:
+        write_html_bundle(TextSpace_dict, savepath / "plotly_spaces.html")
+
 if __name__ == "__main__":
     main()
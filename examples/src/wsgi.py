@@ -0,0 +1,21 @@
+"""
+WSGI entry point for serving the dash app with several worker processes. Run examples/src/preload_spaces.py first, then start the server with
+
+    gunicorn --preload --workers 4 --chdir examples/src wsgi:server
+
+With --preload the corpora are loaded once in the master process before the workers are forked. The embeddings and coordinates are memory-mapped read-only from the space store, so all workers share a single copy in RAM.
+
+The data path can be changed with the TEXTSPACE_DATA environment variable.
+"""
+from pathlib import Path
+import os
+
+import sys
+sys.path.append(str(Path(__file__).parents[2] / "TextSpace"))
+
+from dash_application import get_dash_app
+
+data_path = os.environ.get("TEXTSPACE_DATA", Path(__file__).parents[2] / "data" / "spaces")
+
+app = get_dash_app(data_path=data_path, warm=True)
+server = app.server